@@ -0,0 +1,95 @@
+"""Streaming anomaly detection for OilFox readings."""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, fields
+import math
+from typing import Any
+
+# Smoothing factor of the consumption rate EWMA
+ALPHA = 0.2
+# Readings needed before a leak can be reported
+MIN_SAMPLES = 5
+# Standard deviations above the mean rate to report a leak
+LEAK_SIGMA = 4.0
+# Minimum excess consumption in liters per day to report a leak
+LEAK_MIN_EXCESS = 5.0
+# Consecutive outliers kept out of the baseline before it adapts to them
+OUTLIER_READINGS = 3
+# Increase in liters between two readings which counts as a refill
+REFILL_MIN = 50.0
+# Seconds without a new measurement which count as a stuck sensor
+STUCK_AGE = 7 * 86400
+# Seconds a measurement may be overdue before the sensor counts as stuck
+STUCK_GRACE = 86400
+
+
+@dataclass
+class AnomalyDetector:
+    """Detect leaks, refills and stuck sensors with constant state per device."""
+
+    last_fill: float | None = None
+    last_time: float | None = None
+    rate_mean: float = 0.0
+    rate_var: float = 0.0
+    samples: int = 0
+    outliers: int = 0
+    leak: bool = False
+    refill: bool = False
+    stuck: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> AnomalyDetector:
+        """Restore a detector from storage."""
+        known = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the detector state for storage."""
+        return asdict(self)
+
+    def update(
+        self, fill: float, measured: float, next_measurement: float | None, now: float
+    ) -> set[str]:
+        """Process a reading, return the anomalies which started with it."""
+        previous = {"leak": self.leak, "refill": self.refill, "stuck": self.stuck}
+        overdue = next_measurement is not None and now > next_measurement + STUCK_GRACE
+
+        if self.last_time is None or self.last_fill is None:
+            self.last_fill, self.last_time = fill, measured
+        elif measured > self.last_time:
+            delta = fill - self.last_fill
+            days = (measured - self.last_time) / 86400
+            self.last_fill, self.last_time = fill, measured
+            self.refill = delta >= REFILL_MIN
+            self.leak = False
+            if not self.refill:
+                self._update_rate(max(-delta, 0.0) / days)
+
+        # An unchanged fill level is normal without consumption, only a
+        # measurement time which does not advance means the sensor is stuck.
+        self.stuck = overdue or now - self.last_time > STUCK_AGE
+        current = {"leak": self.leak, "refill": self.refill, "stuck": self.stuck}
+        return {key for key, value in current.items() if value and not previous[key]}
+
+    def _update_rate(self, rate: float) -> None:
+        """Check the consumption rate and fold it into the EWMA."""
+        limit = self.rate_mean + max(
+            LEAK_SIGMA * math.sqrt(self.rate_var), LEAK_MIN_EXCESS
+        )
+        if self.samples >= MIN_SAMPLES and rate > limit:
+            self.leak = True
+            self.outliers += 1
+            if self.outliers <= OUTLIER_READINGS:
+                # Keep single outliers out of the baseline, a lasting change
+                # of the consumption is folded in after a few readings.
+                return
+        else:
+            self.outliers = 0
+        if self.samples == 0:
+            self.rate_mean = rate
+        diff = rate - self.rate_mean
+        increment = ALPHA * diff
+        self.rate_mean += increment
+        self.rate_var = (1 - ALPHA) * (self.rate_var + diff * increment)
+        self.samples += 1
@@ -1,148 +1,352 @@
-"""Oilfox API Class."""
-import asyncio
-import logging
-import time
-
-import aiohttp
-
-from homeassistant.exceptions import ConfigEntryNotReady
-
-_LOGGER = logging.getLogger(__name__)
-
-
-class OilFox:
-    """OilFox Python Class."""
-
-    # https://github.com/foxinsights/customer-api
-    TIMEOUT = 300
-    POLL_INTERVAL = 30
-    TOKEN_VALID = 900
-    hwid: str = ""
-    password: str = ""
-    email: str = ""
-    access_token: str = ""
-    refresh_token: str = ""
-    update_token: int = 0
-    base_url = "https://api.oilfox.io"
-    login_url = base_url + "/customer-api/v1/login"
-    device_url = base_url + "/customer-api/v1/device"
-    token_url = base_url + "/customer-api/v1/token"
-
-    def __init__(self, email, password, hwid, timeout=300, poll_interval=30):
-        """Init Method for OilFox Class."""
-        self.email = email
-        self.password = password
-        self.hwid = hwid
-        self.TIMEOUT = timeout
-        self.POLL_INTERVAL = poll_interval
-        self.state = None
-        #if self.hwid is None or self.hwid == "":
-        #    _LOGGER.info(
-        #        "Init OilFox with Username %s",
-        #        self.email,
-        #        self.TIMEOUT,
-        #        self.POLL_INTERVAL,
-        #    )
-
-    async def test_connection(self):
-        """Test connection to OilFox Api."""
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
-        ) as session, session.get(self.base_url) as response:
-            if response.status == 200:
-                return True
-            return False
-
-    async def test_authentication(self):
-        """Test authentication with OilFox Api."""
-        return await self.get_tokens()
-
-    async def update_stats(self):
-        """Update OilFox API Values."""
-
-        not_error = True
-        if self.refresh_token == "":
-            not_error = await self.get_tokens()
-            # _LOGGER.debug("Update Refresh Token: %s", not_error)
-
-        if int(time.time()) - self.update_token > self.TOKEN_VALID:
-            not_error = await self.get_access_token()
-            _LOGGER.debug("Update Access Token: %s", not_error)
-
-        if not not_error:
-            _LOGGER.debug("Update Access Token failed, Refresh all Tokens!")
-            not_error = await self.get_tokens()
-            _LOGGER.debug("Update Tokens: %s", not_error)
-
-        if not_error:
-            headers = {"Authorization": "Bearer " + self.access_token}
-            async with aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
-            ) as session:
-                try:
-                    async with session.get(
-                        self.device_url + self.hwid, headers=headers
-                    ) as response:
-                        if response.status == 200:
-                            self.state = await response.json()
-                # except asyncio.TimeoutError:
-                #    raise ConfigEntryNotReady(  # noqa: TRY200
-                #        f"Update values failed because of http timeout (waited for {self.TIMEOUT} s)!"
-                #    )
-
-                except Exception as err:
-                    _LOGGER.error(
-                        "Update values failed for unknown reason! %s", repr(err)
-                    )
-                    _LOGGER.error(repr(response))
-                    return False
-
-                return True
-        else:
-            _LOGGER.debug("Could not get Refresh and Access Token:")
-        return False
-
-    async def get_tokens(self):
-        """Update Refresh and Access Token."""
-        headers = {"Content-Type": "application/json"}
-        json_data = {
-            "password": self.password,
-            "email": self.email,
-        }
-
-        async with aiohttp.ClientSession() as session, session.post(
-            self.login_url,
-            headers=headers,
-            json=json_data,
-            timeout=aiohttp.ClientTimeout(total=self.TIMEOUT),
-        ) as response:
-            if response.status == 200:
-                json_response = await response.json()
-                self.access_token = json_response["access_token"]
-                self.refresh_token = json_response["refresh_token"]
-                self.update_token = int(time.time())
-                _LOGGER.debug(
-                    "Update Refresh and Access Token: ok [%s]", response.status
-                )
-                return True
-            _LOGGER.error("Get Refresh Token: failed [%s]", response.status)
-            return False
-
-    async def get_access_token(self):
-        """Update Access Token."""
-        data = {
-            "refresh_token": self.refresh_token,
-        }
-        async with aiohttp.ClientSession() as session, session.post(
-            self.token_url, data=data, timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
-        ) as response:
-            _LOGGER.debug("Get Access Token:%s", response.status)
-            if response.status == 200:
-                json_response = await response.json()
-                self.access_token = json_response["access_token"]
-                self.refresh_token = json_response["refresh_token"]
-                self.update_token = int(time.time())
-                _LOGGER.debug("Update Access Token: ok [%s]", response.status)
-                return True
-            _LOGGER.error("Get Access Token: failed [%s]", response.status)
-            return False
+"""Oilfox API Class.
+
+The client has no Home Assistant dependency. Run this file directly for a
+command line export of all devices of many accounts, see main().
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+import csv
+import json
+import logging
+import sys
+import time
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class OilFox:
+    """OilFox Python Class."""
+
+    # https://github.com/foxinsights/customer-api
+    TIMEOUT = 300
+    POLL_INTERVAL = 30
+    TOKEN_VALID = 900
+    MAX_PARALLEL_FETCHES = 4
+    # Bulk fetch status codes which would fail the single device requests as
+    # well, like the server errors (5xx)
+    NO_FALLBACK_STATUS = (401, 403, 429)
+    hwid: str = ""
+    password: str = ""
+    email: str = ""
+    access_token: str = ""
+    refresh_token: str = ""
+    update_token: int = 0
+    base_url = "https://api.oilfox.io"
+    login_url = base_url + "/customer-api/v1/login"
+    device_url = base_url + "/customer-api/v1/device"
+    token_url = base_url + "/customer-api/v1/token"
+
+    def __init__(
+        self, email, password, hwid, timeout=300, poll_interval=30, session=None
+    ):
+        """Init Method for OilFox Class.
+
+        Pass an aiohttp session to pool connections, otherwise every call
+        opens its own session.
+        """
+        self.session = session
+        self.email = email
+        self.password = password
+        self.hwid = hwid
+        self.TIMEOUT = timeout
+        self.POLL_INTERVAL = poll_interval
+        self.state = None
+        self.stale_devices: set[str] = set()
+        # Called with the endpoint name before every API request
+        self.on_request = None
+        # Decoder of the device responses
+        self.json_loads = json.loads
+        #if self.hwid is None or self.hwid == "":
+        #    _LOGGER.info(
+        #        "Init OilFox with Username %s",
+        #        self.email,
+        #        self.TIMEOUT,
+        #        self.POLL_INTERVAL,
+        #    )
+
+    @asynccontextmanager
+    async def client_session(self):
+        """Return the shared session or a new one for a single call."""
+        if self.session is not None:
+            yield self.session
+            return
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
+        ) as session:
+            yield session
+
+    async def test_connection(self):
+        """Test connection to OilFox Api."""
+        async with self.client_session() as session, session.get(
+            self.base_url, timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
+        ) as response:
+            if response.status == 200:
+                return True
+            return False
+
+    async def test_authentication(self):
+        """Test authentication with OilFox Api."""
+        return await self.get_tokens()
+
+    async def update_stats(self):
+        """Update OilFox API Values."""
+
+        not_error = True
+        if self.refresh_token == "":
+            not_error = await self.get_tokens()
+            # _LOGGER.debug("Update Refresh Token: %s", not_error)
+
+        if int(time.time()) - self.update_token > self.TOKEN_VALID:
+            not_error = await self.get_access_token()
+            _LOGGER.debug("Update Access Token: %s", not_error)
+
+        if not not_error:
+            _LOGGER.debug("Update Access Token failed, Refresh all Tokens!")
+            not_error = await self.get_tokens()
+            _LOGGER.debug("Update Tokens: %s", not_error)
+
+        if not_error:
+            async with self.client_session() as session:
+                status = await self.fetch_devices(session)
+                if status == 401:
+                    # The token was revoked before it expired, log in again
+                    _LOGGER.debug("Access token rejected, Refresh all Tokens!")
+                    self.reset_tokens()
+                    if not await self.get_tokens():
+                        return False
+                    status = await self.fetch_devices(session)
+                if status == 200:
+                    return True
+                if status in self.NO_FALLBACK_STATUS or (status or 0) >= 500:
+                    # The API itself fails, single device requests would too
+                    _LOGGER.error("Update values failed [%s]", status)
+                    return False
+                _LOGGER.error(
+                    "Update values failed [%s], fetch devices one by one", status
+                )
+                return await self.update_devices(session, self.auth_headers())
+        else:
+            _LOGGER.debug("Could not get Refresh and Access Token:")
+        return False
+
+    def auth_headers(self):
+        """Return the headers of authenticated requests."""
+        return {"Authorization": "Bearer " + self.access_token}
+
+    def reset_tokens(self):
+        """Forget the tokens so the next call logs in again."""
+        self.access_token = ""
+        self.refresh_token = ""
+        self.update_token = 0
+
+    async def fetch_devices(self, session):
+        """Fetch all devices, return the HTTP status or None on errors."""
+        try:
+            self.count_request("device")
+            async with session.get(
+                self.device_url + self.hwid,
+                headers=self.auth_headers(),
+                timeout=aiohttp.ClientTimeout(total=self.TIMEOUT),
+            ) as response:
+                if response.status == 200:
+                    self.state = await response.json(loads=self.json_loads)
+                    self.stale_devices = set()
+                return response.status
+        # except asyncio.TimeoutError:
+        #    raise ConfigEntryNotReady(  # noqa: TRY200
+        #        f"Update values failed because of http timeout (waited for {self.TIMEOUT} s)!"
+        #    )
+
+        except Exception as err:
+            _LOGGER.error("Update values failed for unknown reason! %s", repr(err))
+        return None
+
+    def count_request(self, endpoint):
+        """Report an API request to the on_request hook."""
+        if self.on_request is not None:
+            self.on_request(endpoint)
+
+    async def update_devices(self, session, headers):
+        """Update the known devices one by one with bounded concurrency."""
+        if not self.state or not self.state.get("items"):
+            return False
+        semaphore = asyncio.Semaphore(self.MAX_PARALLEL_FETCHES)
+
+        async def update_device(hwid):
+            async with semaphore:
+                try:
+                    self.count_request("device")
+                    async with session.get(
+                        f"{self.device_url}/{hwid}",
+                        headers=headers,
+                        timeout=aiohttp.ClientTimeout(total=self.TIMEOUT),
+                    ) as response:
+                        if response.status == 200:
+                            return await response.json(loads=self.json_loads)
+                        _LOGGER.debug(
+                            "Update device %s failed [%s]", hwid, response.status
+                        )
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+                    _LOGGER.debug("Update device %s failed: %s", hwid, repr(err))
+                return None
+
+        devices = [device for device in self.state["items"] if device.get("hwid")]
+        results = await asyncio.gather(
+            *(update_device(device["hwid"]) for device in devices)
+        )
+        items = []
+        stale_devices = set()
+        for device, result in zip(devices, results):
+            if result and result.get("hwid") == device["hwid"]:
+                items.append(result)
+            else:
+                # Keep the last values and mark them stale
+                items.append(device)
+                stale_devices.add(device["hwid"])
+        self.state = {**self.state, "items": items}
+        self.stale_devices = stale_devices
+        if stale_devices:
+            _LOGGER.warning("Could not update devices: %s", sorted(stale_devices))
+        return len(stale_devices) < len(devices)
+
+    async def get_tokens(self):
+        """Update Refresh and Access Token."""
+        headers = {"Content-Type": "application/json"}
+        json_data = {
+            "password": self.password,
+            "email": self.email,
+        }
+
+        self.count_request("login")
+        async with self.client_session() as session, session.post(
+            self.login_url,
+            headers=headers,
+            json=json_data,
+            timeout=aiohttp.ClientTimeout(total=self.TIMEOUT),
+        ) as response:
+            if response.status == 200:
+                json_response = await response.json()
+                self.access_token = json_response["access_token"]
+                self.refresh_token = json_response["refresh_token"]
+                self.update_token = int(time.time())
+                _LOGGER.debug(
+                    "Update Refresh and Access Token: ok [%s]", response.status
+                )
+                return True
+            _LOGGER.error("Get Refresh Token: failed [%s]", response.status)
+            return False
+
+    async def get_access_token(self):
+        """Update Access Token."""
+        data = {
+            "refresh_token": self.refresh_token,
+        }
+        self.count_request("token")
+        async with self.client_session() as session, session.post(
+            self.token_url, data=data, timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
+        ) as response:
+            _LOGGER.debug("Get Access Token:%s", response.status)
+            if response.status == 200:
+                json_response = await response.json()
+                self.access_token = json_response["access_token"]
+                self.refresh_token = json_response["refresh_token"]
+                self.update_token = int(time.time())
+                _LOGGER.debug("Update Access Token: ok [%s]", response.status)
+                return True
+            _LOGGER.error("Get Access Token: failed [%s]", response.status)
+            return False
+
+
+CSV_FIELDS = (
+    "email",
+    "hwid",
+    "fillLevelPercent",
+    "fillLevelQuantity",
+    "daysReach",
+    "batteryLevel",
+    "validationError",
+    "currentMeteringAt",
+    "nextMeteringAt",
+)
+
+
+def read_accounts(accounts_file):
+    """Read email,password rows, lines starting with # are skipped."""
+    return [
+        (row[0].strip(), row[1].strip())
+        for row in csv.reader(accounts_file)
+        if len(row) >= 2 and not row[0].startswith("#")
+    ]
+
+
+async def export_devices(accounts, output, output_format, concurrency, timeout):
+    """Fetch the devices of all accounts and stream them to output."""
+    writer = None
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as session:
+
+        async def fetch(email, password):
+            async with semaphore:
+                oilfox = OilFox(email, password, "", timeout=timeout, session=session)
+                try:
+                    if await oilfox.update_stats():
+                        return email, oilfox.state.get("items", [])
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    _LOGGER.error("Export of %s failed: %s", email, repr(err))
+                return email, None
+
+        for result in asyncio.as_completed([fetch(*account) for account in accounts]):
+            email, devices = await result
+            if devices is None:
+                failed += 1
+                continue
+            for device in devices:
+                row = {"email": email, **device}
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(row) + "\n")
+            output.flush()
+    return failed
+
+
+def main(argv=None):
+    """Export the devices of many OilFox accounts as NDJSON or CSV."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "accounts",
+        type=argparse.FileType("r"),
+        help="CSV file with email,password per line, - for stdin",
+    )
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=int, default=OilFox.TIMEOUT)
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    failed = asyncio.run(
+        export_devices(
+            read_accounts(args.accounts),
+            sys.stdout,
+            args.format,
+            max(args.concurrency, 1),
+            args.timeout,
+        )
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Profiler for the OilFox refresh pipeline."""
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import cProfile
+from functools import wraps
+import io
+import pstats
+from typing import Any
+
+TOP_FUNCTIONS = 25
+
+
+class RefreshProfiler:
+    """Collect a profile over a number of coordinator refreshes.
+
+    Only synchronous code is profiled, a profile across an await would
+    include whatever else the event loop runs meanwhile.
+    """
+
+    def __init__(self, runs: int, callback_budget: float) -> None:
+        """Init the profiler for the given number of refreshes."""
+        self.remaining = runs
+        self.callback_budget = callback_budget
+        self.slow_callbacks: list[tuple[str, float]] = []
+        self._profile = cProfile.Profile()
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """Profile the wrapped block."""
+        try:
+            self._profile.enable()
+        except ValueError:
+            # Another profiler is active, e.g. a second entry refreshing
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._profile.disable()
+
+    def wrap(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return func profiled on every call."""
+
+        @wraps(func)
+        def profiled(*args: Any, **kwargs: Any) -> Any:
+            with self.profile():
+                return func(*args, **kwargs)
+
+        return profiled
+
+    def check_callback(self, update_callback: Callable, elapsed: float) -> None:
+        """Remember listener callbacks which exceeded the loop-time budget."""
+        if elapsed > self.callback_budget:
+            owner = getattr(update_callback, "__self__", None)
+            name = getattr(owner, "entity_id", None) or repr(update_callback)
+            self.slow_callbacks.append((name, elapsed))
+
+    def finish_run(self) -> bool:
+        """Count a finished refresh, return True if all runs are done."""
+        self.remaining -= 1
+        return self.remaining <= 0
+
+    def write(self, path: str) -> str:
+        """Write the profile and its summary, return the summary."""
+        self._profile.dump_stats(path)
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        stream.write(
+            f"Callbacks over the loop-time budget of {self.callback_budget} s: "
+            f"{len(self.slow_callbacks)}\n"
+        )
+        for name, elapsed in sorted(
+            self.slow_callbacks, key=lambda item: item[1], reverse=True
+        ):
+            stream.write(f"  {name}: {elapsed:.4f} s\n")
+        summary = stream.getvalue()
+        with open(f"{path}.txt", "w", encoding="utf-8") as summary_file:
+            summary_file.write(summary)
+        return summary
@@ -0,0 +1,90 @@
+"""Daily API request budget for an OilFox account."""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+WINDOW = 86400
+BUCKET = 3600
+# Smoothing factor of the requests per refresh estimate
+ALPHA = 0.3
+
+
+class RequestBudget:
+    """Track API requests per endpoint in a rolling 24 h window.
+
+    Requests are counted in hourly buckets so the state stays small and
+    can be persisted.
+    """
+
+    def __init__(self, daily_budget: int) -> None:
+        """Init the budget, 0 means unlimited."""
+        self.daily_budget = daily_budget
+        self.buckets: dict[str, dict[int, int]] = {}
+        self.refresh_cost = 1.0
+        self.recorded = 0
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore the counts from storage."""
+        self.buckets = {
+            endpoint: {int(bucket): count for bucket, count in buckets.items()}
+            for endpoint, buckets in data.get("buckets", {}).items()
+        }
+        self.refresh_cost = data.get("refresh_cost", self.refresh_cost)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counts for storage."""
+        return {"buckets": self.buckets, "refresh_cost": self.refresh_cost}
+
+    def record(self, endpoint: str, now: float | None = None) -> None:
+        """Count a request to an endpoint."""
+        bucket = int(now or time.time()) // BUCKET
+        buckets = self.buckets.setdefault(endpoint, {})
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        self.recorded += 1
+        self._expire(bucket)
+
+    def record_refresh(self, requests: int) -> None:
+        """Update the estimate of requests per refresh."""
+        if requests:
+            self.refresh_cost += ALPHA * (requests - self.refresh_cost)
+
+    def used(self, now: float | None = None) -> dict[str, int]:
+        """Return the requests per endpoint in the current window."""
+        oldest = int(now or time.time()) // BUCKET - WINDOW // BUCKET
+        return {
+            endpoint: sum(
+                count for bucket, count in buckets.items() if bucket > oldest
+            )
+            for endpoint, buckets in self.buckets.items()
+        }
+
+    def remaining(self, now: float | None = None) -> int | None:
+        """Return the requests left in the current window."""
+        if not self.daily_budget:
+            return None
+        return max(self.daily_budget - sum(self.used(now).values()), 0)
+
+    def interval(self, base_interval: float, now: float | None = None) -> float:
+        """Return the poll interval in seconds which keeps within the budget."""
+        if not self.daily_budget:
+            return base_interval
+        now = now or time.time()
+        # Spread the budget evenly over the day
+        interval = max(base_interval, WINDOW * self.refresh_cost / self.daily_budget)
+        remaining = self.remaining(now)
+        if remaining < self.refresh_cost:
+            # Wait until the oldest requests leave the window
+            buckets = [bucket for b in self.buckets.values() for bucket in b]
+            if buckets:
+                free_at = min(buckets) * BUCKET + WINDOW
+                interval = max(interval, free_at - now)
+        return interval
+
+    def _expire(self, current_bucket: int) -> None:
+        """Drop buckets which left the window."""
+        oldest = current_bucket - WINDOW // BUCKET
+        for buckets in self.buckets.values():
+            for bucket in [bucket for bucket in buckets if bucket <= oldest]:
+                del buckets[bucket]
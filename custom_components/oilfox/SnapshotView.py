@@ -0,0 +1,73 @@
+"""HTTP view exporting the OilFox snapshot."""
+
+import csv
+import hashlib
+from http import HTTPStatus
+import io
+from typing import Any
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.json import json_bytes
+
+from .const import DOMAIN, EXPORT_FIELDS
+
+FORMAT_CSV = "csv"
+FORMAT_JSON = "json"
+CONTENT_TYPES = {FORMAT_CSV: "text/csv", FORMAT_JSON: "application/json"}
+
+
+class SnapshotView(HomeAssistantView):
+    """Export the current devices of all OilFox entries."""
+
+    url = "/api/oilfox/snapshot"
+    name = "api:oilfox:snapshot"
+
+    def __init__(self) -> None:
+        """Init the view with an empty output cache."""
+        self._cache: dict[str, tuple[str, bytes]] = {}
+
+    async def get(self, request: web.Request) -> web.Response:
+        """Return the snapshot as JSON or CSV."""
+        hass: HomeAssistant = request.app["hass"]
+        output_format = request.query.get("format", FORMAT_JSON)
+        if output_format not in CONTENT_TYPES:
+            return self.json_message(
+                f"Unsupported format: {output_format}", HTTPStatus.BAD_REQUEST
+            )
+
+        exports = [
+            coordinator.export_rows()
+            for coordinator in hass.data.get(DOMAIN, {}).values()
+            if coordinator.data
+        ]
+        digest = hashlib.sha256(
+            "".join(fingerprint for fingerprint, _ in exports).encode()
+        ).hexdigest()
+        etag = f'"{digest}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+
+        cached = self._cache.get(output_format)
+        if cached is None or cached[0] != etag:
+            rows = [row for _, entry_rows in exports for row in entry_rows]
+            cached = (etag, self._render(output_format, rows))
+            self._cache[output_format] = cached
+        return web.Response(
+            body=cached[1],
+            content_type=CONTENT_TYPES[output_format],
+            headers={"ETag": etag},
+        )
+
+    @staticmethod
+    def _render(output_format: str, rows: list[dict[str, Any]]) -> bytes:
+        """Render the device rows."""
+        if output_format == FORMAT_JSON:
+            return json_bytes({"items": rows})
+        stream = io.StringIO()
+        writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return stream.getvalue().encode()
@@ -1,44 +1,551 @@
 """Coordinator for OilFox."""
 
-from datetime import timedelta
+import asyncio
+from datetime import datetime, timedelta
+import hashlib
+import json
 import logging
+import random
+import time
+from types import MappingProxyType
+from typing import Any
 
-from homeassistant.core import HomeAssistant
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import update_coordinator
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN, POLL_INTERVAL
+from .const import (
+    BATTERY_LOW,
+    BATTERY_MAPPING,
+    CONF_DAILY_BUDGET,
+    CONF_POLL_INTERVAL,
+    CONF_WEBHOOK,
+    COUNTERS,
+    DAILY_BUDGET,
+    DOMAIN,
+    EVENT_ANOMALY,
+    EXPORT_FIELDS,
+    HEATING_SEASON_START_MONTH,
+    PERIODS,
+    POLL_INTERVAL,
+    RECONCILE_INTERVAL,
+    REFRESH_JITTER,
+    SNAPSHOT_MAX_AGE,
+    STORAGE_MINOR_VERSION,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION,
+    UNLOAD_TIMEOUT,
+)
+from .AnomalyDetector import AnomalyDetector
 from .OilFox import OilFox
+from .RefreshProfiler import RefreshProfiler
+from .RequestBudget import RequestBudget
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def period_start(period: str, now: datetime) -> datetime:
+    """Return the local start of the consumption period containing now."""
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "weekly":
+        return start - timedelta(days=start.weekday())
+    if period == "monthly":
+        return start.replace(day=1)
+    if period == "heatingSeason":
+        year = start.year
+        if start.month < HEATING_SEASON_START_MONTH:
+            year -= 1
+        return start.replace(year=year, month=HEATING_SEASON_START_MONTH, day=1)
+    return start
+
+
+def _metering_time(oilfox_device: dict[str, Any]) -> float:
+    """Return the measurement time of a device record as a timestamp."""
+    if not oilfox_device.get("currentMeteringAt"):
+        return 0.0
+    return datetime.fromisoformat(str(oilfox_device["currentMeteringAt"])).timestamp()
+
+
+class OilFoxStore(Store):
+    """Store for the persisted OilFox entry data."""
+
+    async def _async_migrate_func(
+        self, old_major_version: int, old_minor_version: int, old_data: dict
+    ) -> dict:
+        """Migrate the stored data to the current version."""
+        if old_major_version == 1 and old_minor_version < 2:
+            # Counters without "value" are migrated from their last state
+            # by the entities.
+            old_data.setdefault("counters", {})
+        return old_data
+
+
 class UpdateCoordinator(update_coordinator.DataUpdateCoordinator):
     """Class to manage fetching Opengarage data."""
 
     def __init__(
         self,
         hass: HomeAssistant,
+        config_entry: ConfigEntry,
         *,
         oilfox_api: OilFox,
     ) -> None:
         """Initialize global OilFox data updater."""
         self.oilfox_api = oilfox_api
+        # Options the entry was set up with
+        self.options = dict(config_entry.options)
+        self._store: OilFoxStore = OilFoxStore(
+            hass,
+            STORAGE_VERSION,
+            f"{DOMAIN}.{config_entry.entry_id}",
+            minor_version=STORAGE_MINOR_VERSION,
+        )
+        self._storage_data: dict[str, Any] = {"counters": {}}
+        self.devices: dict[str, dict[str, Any]] = {}
+        self.device_attributes: dict[str, MappingProxyType] = {}
+        self._device_infos: dict[str, DeviceInfo] = {}
+        self._device_prefill: dict[str, dict[str, Any]] = {}
+        self._export: tuple[str, list[dict[str, Any]]] | None = None
+        self.anomaly_detectors: dict[str, AnomalyDetector] = {}
+        # Entities built for the platforms during setup
+        self.platform_entities: dict[str, list] = {}
+        self.profiler: RefreshProfiler | None = None
+        self._pushed: dict[str, dict[str, Any]] = {}
+        self._fetch_task: asyncio.Task | None = None
+        self._closing = False
+        self.request_budget = RequestBudget(
+            config_entry.options.get(CONF_DAILY_BUDGET, DAILY_BUDGET)
+        )
+        oilfox_api.on_request = self.request_budget.record
 
-        # _LOGGER.info("Load poll interval: %s", POLL_INTERVAL)
+        poll_interval = config_entry.options.get(CONF_POLL_INTERVAL, POLL_INTERVAL)
+        if config_entry.options.get(CONF_WEBHOOK):
+            # Measurements are pushed, polling only reconciles the snapshot
+            poll_interval = max(poll_interval, RECONCILE_INTERVAL)
+        _LOGGER.debug("Load poll interval: %s", poll_interval)
+        self._base_interval = timedelta(minutes=poll_interval)
 
         super().__init__(
             hass,
             _LOGGER,
+            config_entry=config_entry,
             name=DOMAIN,
-            update_interval=timedelta(minutes=POLL_INTERVAL),
+            update_interval=self._base_interval,
+        )
+
+    async def async_close(self) -> None:
+        """Stop refreshing, cancel API requests and flush the storage."""
+        self._closing = True
+        await self.async_shutdown()
+        if (fetch_task := self._fetch_task) is not None and not fetch_task.done():
+            fetch_task.cancel()
+            _, pending = await asyncio.wait({fetch_task}, timeout=UNLOAD_TIMEOUT)
+            if pending:
+                _LOGGER.warning("OilFox: API requests still running after unload")
+        await self._store.async_save(self._data_to_save())
+
+    async def async_load_storage(self) -> None:
+        """Load the persisted integration data for this entry."""
+        data = await self._store.async_load()
+        if data:
+            self._storage_data = data
+        self._storage_data.setdefault("counters", {})
+        self._storage_data.setdefault("anomaly", {})
+        self._storage_data.setdefault("periods", {})
+        self._storage_data.setdefault("fill_levels", {})
+        self.request_budget.restore(self._storage_data.get("budget", {}))
+        self.anomaly_detectors = {
+            hwid: AnomalyDetector.from_dict(state)
+            for hwid, state in self._storage_data["anomaly"].items()
+        }
+
+    @callback
+    def async_restore_snapshot(self) -> bool:
+        """Use the cached snapshot until the first staggered refresh."""
+        snapshot = self._storage_data.get("snapshot")
+        if not snapshot or time.time() - snapshot["time"] > SNAPSHOT_MAX_AGE:
+            return False
+        _LOGGER.debug("Restore cached snapshot from %s", snapshot["time"])
+        self._index_devices(snapshot["data"])
+        self.data = snapshot["data"]
+        # The client falls back to its last state if a refresh fails
+        self.oilfox_api.state = snapshot["data"]
+        return True
+
+    def refresh_delay(self) -> float:
+        """Return the seconds until this entry's next refresh slot.
+
+        Every entry gets a fixed phase on the wall clock derived from its
+        entry id, so entries and restarts do not refresh in lockstep.
+        """
+        interval = self.update_interval.total_seconds()
+        entry_hash = hashlib.sha256(self.config_entry.entry_id.encode()).hexdigest()
+        phase = int(entry_hash, 16) % int(interval)
+        jitter = random.uniform(0, min(REFRESH_JITTER, interval / 10))
+        return (phase + jitter - time.time()) % interval
+
+    async def async_staggered_refresh(self, _now: datetime) -> None:
+        """Run the refresh scheduled at the entry's phase offset."""
+        await self.async_refresh()
+
+    @callback
+    def _async_store_snapshot(self, data: dict[str, Any]) -> None:
+        """Cache the snapshot to cover the next startup."""
+        self._storage_data["snapshot"] = {"time": time.time(), "data": data}
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the data to persist."""
+        self._storage_data["anomaly"] = {
+            hwid: detector.as_dict()
+            for hwid, detector in self.anomaly_detectors.items()
+        }
+        self._storage_data["budget"] = self.request_budget.as_dict()
+        return self._storage_data
+
+    @callback
+    def counter(self, hwid: str, sensor_id: str) -> dict[str, Any] | None:
+        """Return the stored state of a usage counter."""
+        return self._storage_data["counters"].get(hwid, {}).get(sensor_id)
+
+    @callback
+    def async_seed_counter(
+        self, hwid: str, sensor_id: str, value: float, current: int, previous: int
+    ) -> None:
+        """Store the initial state of a usage counter."""
+        self._storage_data["counters"].setdefault(hwid, {})[sensor_id] = {
+            "value": value,
+            "current": current,
+            "previous": previous,
+        }
+        self._export = None
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _async_update_counters(self) -> None:
+        """Add the consumption of new readings to the usage counters."""
+        changed = False
+        now = dt_util.now()
+        for hwid, oilfox_device in self.devices.items():
+            changed |= self._async_roll_periods(hwid, now)
+            if oilfox_device.get("fillLevelQuantity") is None:
+                continue
+            fill_level = int(oilfox_device["fillLevelQuantity"])
+            counters = self._storage_data["counters"].get(hwid, {})
+            for sensor_id, counter in counters.items():
+                # Counters are seeded by their entity before they count
+                if "value" not in counter or counter["current"] == fill_level:
+                    continue
+                # A higher fill level is a refill and not counted
+                consumed = max(counter["current"] - fill_level, 0)
+                counter["value"] = round(
+                    counter["value"] + consumed * COUNTERS[sensor_id], 2
+                )
+                counter["previous"] = counter["current"]
+                counter["current"] = fill_level
+                changed = True
+            # The periods follow the device's own last reading, independent
+            # of whether the counter entities are set up.
+            last_level = self._storage_data["fill_levels"].get(hwid)
+            if last_level == fill_level:
+                continue
+            self._storage_data["fill_levels"][hwid] = fill_level
+            changed = True
+            if last_level is not None and last_level > fill_level:
+                for period in self._storage_data["periods"][hwid].values():
+                    period["value"] = round(
+                        period["value"] + last_level - fill_level, 2
+                    )
+        if changed:
+            self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _async_roll_periods(self, hwid: str, now: datetime) -> bool:
+        """Reset the consumption periods of a device at their boundary."""
+        periods = self._storage_data["periods"].setdefault(hwid, {})
+        changed = False
+        for period in PERIODS:
+            start = period_start(period, now).isoformat()
+            if periods.get(period, {}).get("start") != start:
+                periods[period] = {"start": start, "value": 0.0}
+                changed = True
+        return changed
+
+    @callback
+    def consumption(self, hwid: str, period: str) -> tuple[float, datetime] | None:
+        """Return the consumption in liters and start of a period."""
+        state = self._storage_data["periods"].get(hwid, {}).get(period)
+        if state is None:
+            return None
+        return state["value"], datetime.fromisoformat(state["start"])
+
+    @callback
+    def _async_update_anomalies(self) -> None:
+        """Feed the readings into the per-device anomaly detectors."""
+        now = time.time()
+        for hwid, oilfox_device in self.devices.items():
+            if (
+                oilfox_device.get("fillLevelQuantity") is None
+                or not oilfox_device.get("currentMeteringAt")
+            ):
+                continue
+            detector = self.anomaly_detectors.setdefault(hwid, AnomalyDetector())
+            next_measurement = None
+            if oilfox_device.get("nextMeteringAt"):
+                next_measurement = datetime.fromisoformat(
+                    str(oilfox_device["nextMeteringAt"])
+                ).timestamp()
+            started = detector.update(
+                float(oilfox_device["fillLevelQuantity"]),
+                datetime.fromisoformat(
+                    str(oilfox_device["currentMeteringAt"])
+                ).timestamp(),
+                next_measurement,
+                now,
+            )
+            for anomaly in started:
+                _LOGGER.info("OilFox: Detected %s for device %s", anomaly, hwid)
+                self.hass.bus.async_fire(
+                    EVENT_ANOMALY,
+                    {
+                        "hwid": hwid,
+                        "type": anomaly,
+                        "fill_level_quantity": detector.last_fill,
+                        "rate_mean": round(detector.rate_mean, 2),
+                    },
+                )
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def async_start_profiler(self, runs: int, callback_budget: float) -> None:
+        """Profile the next refreshes including the listener fan-out."""
+        self.profiler = RefreshProfiler(runs, callback_budget)
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, profiled if requested."""
+        if (profiler := self.profiler) is None:
+            super().async_update_listeners()
+            return
+        with profiler.profile():
+            for update_callback, _ in list(self._listeners.values()):
+                start = time.perf_counter()
+                update_callback()
+                profiler.check_callback(update_callback, time.perf_counter() - start)
+        if profiler.finish_run():
+            self.profiler = None
+            self.hass.async_create_task(self._async_write_profile(profiler))
+
+    async def _async_write_profile(self, profiler: RefreshProfiler) -> None:
+        """Write a finished profile to the config directory."""
+        path = self.hass.config.path(
+            f"{DOMAIN}_profile_{self.config_entry.entry_id}_{int(time.time())}.cprof"
         )
+        summary = await self.hass.async_add_executor_job(profiler.write, path)
+        _LOGGER.warning("OilFox: Profile written to %s\n%s", path, summary)
 
-    async def _async_update_data(self) -> None:
+    async def _async_update_data(self) -> dict[str, Any] | None:
         """Fetch data."""
         # _LOGGER.debug("UpdateCoordinator _async_update_data")
-        # try:
-        await self.oilfox_api.update_stats()
-        # except Exception as err:
-        #    raise ConfigEntryNotReady(repr(err)) from err
+        if (profiler := self.profiler) is None:
+            self.oilfox_api.json_loads = json.loads
+            await self._async_fetch_data()
+            return self._async_process_data()
+        # Profile the decoding and the processing, not the requests
+        self.oilfox_api.json_loads = profiler.wrap(json.loads)
+        await self._async_fetch_data()
+        with profiler.profile():
+            return self._async_process_data()
+
+    async def _async_fetch_data(self) -> None:
+        """Fetch data from the OilFox API."""
+        recorded = self.request_budget.recorded
+        # Run the requests in their own task so unload can cancel them
+        self._fetch_task = self.hass.async_create_task(
+            self.oilfox_api.update_stats(), f"{DOMAIN} update_stats"
+        )
+        try:
+            updated = await self._fetch_task
+        except asyncio.CancelledError:
+            if not self._closing:
+                raise
+            raise update_coordinator.UpdateFailed("Refresh cancelled by unload")
+        finally:
+            self._fetch_task = None
+        self._async_apply_budget(self.request_budget.recorded - recorded)
+        if not updated:
+            # The current data is kept, it may hold newer pushed readings
+            raise update_coordinator.UpdateFailed("No device could be updated")
+
+    @callback
+    def _async_process_data(self) -> dict[str, Any]:
+        """Index the fetched snapshot and update the derived state."""
+        self._merge_pushed(self.oilfox_api.state)
+        self._async_store_snapshot(self.oilfox_api.state)
+        self._index_devices(self.oilfox_api.state)
+        self._async_update_counters()
+        self._async_update_anomalies()
         return self.oilfox_api.state
+
+    @callback
+    def _async_apply_budget(self, requests: int) -> None:
+        """Stretch the poll interval to stay within the daily request budget.
+
+        Only scheduled refreshes follow the interval, first and requested
+        refreshes always run.
+        """
+        self.request_budget.record_refresh(requests)
+        interval = timedelta(
+            seconds=self.request_budget.interval(self._base_interval.total_seconds())
+        )
+        if interval != self.update_interval:
+            _LOGGER.debug(
+                "Poll interval %s to stay within the request budget", interval
+            )
+            self.update_interval = interval
+
+    @callback
+    def async_ingest_devices(self, items: list[dict[str, Any]]) -> int:
+        """Merge pushed device payloads into the snapshot, return merged count."""
+        if not self.data:
+            return 0
+        pushed = {item["hwid"]: item for item in items}
+        merged: dict[str, dict[str, Any]] = {}
+        merged_items = []
+        for oilfox_device in self.data["items"]:
+            item = pushed.pop(oilfox_device.get("hwid"), None)
+            if item is not None:
+                # Late or replayed readings would count the consumption twice
+                if _metering_time(item) > _metering_time(oilfox_device):
+                    oilfox_device = {**oilfox_device, **item}
+                    merged[item["hwid"]] = item
+                else:
+                    _LOGGER.debug(
+                        "Ignore pushed reading of %s which is not newer",
+                        item["hwid"],
+                    )
+            merged_items.append(oilfox_device)
+        if pushed:
+            _LOGGER.debug("Ignore pushed data of unknown devices: %s", list(pushed))
+        self.oilfox_api.stale_devices.difference_update(merged)
+        if merged:
+            self._pushed.update(merged)
+            data = {**self.data, "items": merged_items}
+            # The client keeps the pushed readings for refreshes which fall
+            # back to the last known device data.
+            self.oilfox_api.state = data
+            self._index_devices(data)
+            self._async_update_counters()
+            self._async_update_anomalies()
+            self._async_store_snapshot(data)
+            self.async_set_updated_data(data)
+        return len(merged)
+
+    def _merge_pushed(self, data: dict[str, Any]) -> None:
+        """Keep pushed readings which are newer than the polled ones."""
+        if not self._pushed or "items" not in data:
+            return
+        items = []
+        for oilfox_device in data["items"]:
+            pushed = self._pushed.get(oilfox_device.get("hwid"))
+            if pushed is not None:
+                if _metering_time(pushed) > _metering_time(oilfox_device):
+                    oilfox_device = {**oilfox_device, **pushed}
+                else:
+                    # The API caught up with the pushed reading
+                    del self._pushed[oilfox_device["hwid"]]
+            items.append(oilfox_device)
+        data["items"] = items
+
+    def _index_devices(self, data: dict | None) -> None:
+        """Index the device list by hwid and build shared per-device attributes."""
+        if not data or "items" not in data:
+            return
+        devices = {}
+        device_attributes = {}
+        for oilfox_device in data["items"]:
+            hwid = oilfox_device.get("hwid")
+            if not hwid:
+                # A broken record must not block the other devices
+                _LOGGER.debug("Skip device record without hwid: %r", oilfox_device)
+                continue
+            devices[hwid] = oilfox_device
+            attributes = {
+                "Last Measurement": oilfox_device.get("currentMeteringAt"),
+                "Next Measurement": oilfox_device.get("nextMeteringAt"),
+                "Battery": oilfox_device.get("batteryLevel"),
+            }
+            # Keep the previous mapping if nothing changed so entities can
+            # compare attributes by identity.
+            previous = self.device_attributes.get(hwid)
+            if previous is not None and previous == attributes:
+                device_attributes[hwid] = previous
+            else:
+                device_attributes[hwid] = MappingProxyType(attributes)
+        self.devices = devices
+        self.device_attributes = device_attributes
+        self._device_prefill = {}
+        self._export = None
+
+    def export_rows(self) -> tuple[str, list[dict[str, Any]]]:
+        """Return the fingerprint and device rows of the snapshot export.
+
+        Built once per snapshot, including the derived battery percentage
+        and consumption totals.
+        """
+        if self._export is None:
+            rows = []
+            for hwid, oilfox_device in self.devices.items():
+                row = {field: oilfox_device.get(field) for field in EXPORT_FIELDS}
+                row["batteryPercent"] = BATTERY_MAPPING.get(
+                    oilfox_device.get("batteryLevel")
+                )
+                for sensor_id in COUNTERS:
+                    counter = self.counter(hwid, sensor_id)
+                    row[sensor_id] = (counter or {}).get("value")
+                rows.append(row)
+            fingerprint = hashlib.sha256(
+                json.dumps(rows, sort_keys=True, default=str).encode()
+            ).hexdigest()
+            self._export = (fingerprint, rows)
+        return self._export
+
+    def device_prefill(self, hwid: str) -> dict[str, Any]:
+        """Return the parsed initial entity values of a device.
+
+        Built once per snapshot and shared by both platforms.
+        """
+        if hwid not in self._device_prefill:
+            oilfox_device = self.devices[hwid]
+            prefill = dict(oilfox_device)
+            prefill["batteryLevel"] = BATTERY_MAPPING.get(
+                oilfox_device.get("batteryLevel")
+            )
+            for key in ("currentMeteringAt", "nextMeteringAt"):
+                if oilfox_device.get(key):
+                    prefill[key] = datetime.fromisoformat(str(oilfox_device[key]))
+            prefill.setdefault("validationError", "No Error")
+            prefill["validationErrorStatus"] = "validationError" in oilfox_device
+            prefill["batteryLevelStatus"] = (
+                oilfox_device.get("batteryLevel") in BATTERY_LOW
+            )
+            self._device_prefill[hwid] = prefill
+        return self._device_prefill[hwid]
+
+    @property
+    def stale_devices(self) -> set[str]:
+        """Return the devices which could not be updated on the last refresh."""
+        return self.oilfox_api.stale_devices
+
+    def device_info(self, hwid: str) -> DeviceInfo:
+        """Return the shared device info for a hwid."""
+        if hwid not in self._device_infos:
+            self._device_infos[hwid] = DeviceInfo(
+                identifiers={(DOMAIN, hwid)},
+                name=f"OilFox-{hwid}",
+            )
+        return self._device_infos[hwid]
@@ -1,43 +1,222 @@
 """The oilfox component."""
 from __future__ import annotations
 import asyncio
+from datetime import datetime
+from http import HTTPStatus
 import logging
 
+from aiohttp import web
+import voluptuous as vol
+
+from homeassistant.components import webhook
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.typing import ConfigType
 
-from .const import CONF_EMAIL, CONF_PASSWORD, CONF_HTTP_TIMEOUT, DOMAIN
+from .const import (
+    ATTR_CALLBACK_BUDGET,
+    ATTR_REFRESHES,
+    CALLBACK_BUDGET,
+    CONF_EMAIL,
+    CONF_HTTP_TIMEOUT,
+    CONF_PASSWORD,
+    CONF_WEBHOOK,
+    CONF_WEBHOOK_ID,
+    DOMAIN,
+    REFRESH_JITTER,
+    SERVICE_PROFILE,
+    TIMEOUT,
+)
+from .binary_sensor import BINARY_SENSORS, OilFoxBinarySensor
 from .OilFox import OilFox
+from .sensor import SENSORS, OilFoxBudgetSensor, OilFoxSensor
+from .SnapshotView import SnapshotView
 from .UpdateCoordinator import UpdateCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 PLATFORMS = [Platform.SENSOR, Platform.BINARY_SENSOR]
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+SERVICE_PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_REFRESHES, default=1): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=100)
+        ),
+        vol.Optional(ATTR_CALLBACK_BUDGET, default=CALLBACK_BUDGET): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+    }
+)
+
+
+def _iso_datetime(value: str) -> str:
+    """Validate an ISO 8601 timestamp and keep it as a string like the API."""
+    try:
+        datetime.fromisoformat(str(value))
+    except ValueError as err:
+        raise vol.Invalid(f"Invalid timestamp: {value}") from err
+    return str(value)
+
+
+# Pushed payloads use the same shape as the API "items" entries
+DEVICE_SCHEMA = vol.Schema(
+    {
+        vol.Required("hwid"): str,
+        vol.Optional("fillLevelQuantity"): vol.Any(None, vol.Coerce(int)),
+        vol.Optional("fillLevelPercent"): vol.Any(None, vol.Coerce(int)),
+        vol.Optional("daysReach"): vol.Any(None, vol.Coerce(int)),
+        vol.Optional("currentMeteringAt"): vol.Any(None, _iso_datetime),
+        vol.Optional("nextMeteringAt"): vol.Any(None, _iso_datetime),
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+WEBHOOK_SCHEMA = vol.Schema(
+    vol.Any({vol.Required("items"): [DEVICE_SCHEMA]}, DEVICE_SCHEMA)
+)
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Register the OilFox services."""
+
+    async def async_profile(call: ServiceCall) -> None:
+        """Profile the next refreshes of all OilFox entries."""
+        for coordinator in hass.data.get(DOMAIN, {}).values():
+            coordinator.async_start_profiler(
+                call.data[ATTR_REFRESHES], call.data[ATTR_CALLBACK_BUDGET]
+            )
+        _LOGGER.info(
+            "OilFox: Profiling the next %s refreshes", call.data[ATTR_REFRESHES]
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile, schema=SERVICE_PROFILE_SCHEMA
+    )
+    hass.http.register_view(SnapshotView())
+    return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Setup OilFox with config entry."""  # noqa: D401
     # _LOGGER.debug("async_setup_entry __init__")
     hass.data.setdefault(DOMAIN, {})
-    my_oilfox = OilFox(entry.data[CONF_EMAIL], entry.data[CONF_PASSWORD], "")
-    oilfox_data_coordinator = UpdateCoordinator(hass, oilfox_api=my_oilfox)
+    # Unload aborts the requests by cancelling the coordinator's fetch task,
+    # the shared session stays open.
+    my_oilfox = OilFox(
+        entry.data[CONF_EMAIL],
+        entry.data[CONF_PASSWORD],
+        "",
+        timeout=entry.options.get(CONF_HTTP_TIMEOUT, TIMEOUT),
+        session=async_get_clientsession(hass),
+    )
+    oilfox_data_coordinator = UpdateCoordinator(hass, entry, oilfox_api=my_oilfox)
+    await oilfox_data_coordinator.async_load_storage()
 
-    await oilfox_data_coordinator.async_config_entry_first_refresh()
+    # Cached data covers the time until the staggered refresh, only refresh
+    # right away if there is nothing to show yet.
+    refreshed = not oilfox_data_coordinator.async_restore_snapshot()
+    if refreshed:
+        await oilfox_data_coordinator.async_config_entry_first_refresh()
+    refresh_delay = oilfox_data_coordinator.refresh_delay()
+    if refreshed and refresh_delay < REFRESH_JITTER:
+        # The first refresh already ran in the jitter window of the slot
+        _LOGGER.debug("OilFox: Skip the refresh in %.0f s", refresh_delay)
+    else:
+        _LOGGER.debug("OilFox: Next refresh in %.0f s", refresh_delay)
+        entry.async_on_unload(
+            async_call_later(
+                hass, refresh_delay, oilfox_data_coordinator.async_staggered_refresh
+            )
+        )
     hass.data[DOMAIN][entry.entry_id] = oilfox_data_coordinator
+    oilfox_data_coordinator.platform_entities = _build_entities(
+        oilfox_data_coordinator
+    )
+
+    if entry.options.get(CONF_WEBHOOK):
+        webhook_id = entry.options[CONF_WEBHOOK_ID]
+        webhook.async_register(
+            hass, DOMAIN, entry.title, webhook_id, async_handle_webhook
+        )
+        entry.async_on_unload(lambda: webhook.async_unregister(hass, webhook_id))
+        _LOGGER.info(
+            "OilFox: Accept pushed measurements on %s",
+            webhook.async_generate_url(hass, webhook_id),
+        )
 
     """Register Handler for options flow update."""
-    entry.add_update_listener(update_listener)
+    entry.async_on_unload(entry.add_update_listener(update_listener))
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
+def _build_entities(coordinator: UpdateCoordinator) -> dict[Platform, list[Entity]]:
+    """Build the entities of both platforms in one pass over the devices."""
+    sensors: list[Entity] = []
+    binary_sensors: list[Entity] = []
+    for hwid in coordinator.devices:
+        prefill = coordinator.device_prefill(hwid)
+        sensors.extend(
+            OilFoxSensor(coordinator, hwid, sensor_details, prefill)
+            for sensor_details in SENSORS.values()
+        )
+        binary_sensors.extend(
+            OilFoxBinarySensor(coordinator, hwid, sensor_details, prefill)
+            for sensor_details in BINARY_SENSORS.values()
+        )
+    if coordinator.request_budget.daily_budget:
+        sensors.append(OilFoxBudgetSensor(coordinator))
+    _LOGGER.info(
+        "OilFox: Setup %s sensors and %s binary sensors for %s devices of %s",
+        len(sensors),
+        len(binary_sensors),
+        len(coordinator.devices),
+        coordinator.config_entry.data[CONF_EMAIL],
+    )
+    return {Platform.SENSOR: sensors, Platform.BINARY_SENSOR: binary_sensors}
+
+async def async_handle_webhook(
+    hass: HomeAssistant, webhook_id: str, request: web.Request
+) -> web.Response:
+    """Merge device payloads pushed by a local bridge into the snapshot."""
+    try:
+        payload = WEBHOOK_SCHEMA(await request.json())
+    except (ValueError, vol.Invalid) as err:
+        _LOGGER.warning("OilFox: Invalid webhook payload: %s", err)
+        return web.Response(status=HTTPStatus.BAD_REQUEST)
+
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        if entry.options.get(CONF_WEBHOOK_ID) == webhook_id:
+            break
+    else:
+        return web.Response(status=HTTPStatus.NOT_FOUND)
+    coordinator = hass.data[DOMAIN].get(entry.entry_id)
+    if coordinator is None:
+        return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+    items = payload.get("items", [payload])
+    merged = coordinator.async_ingest_devices(items)
+    _LOGGER.debug("OilFox: Merged %s of %s pushed devices", merged, len(items))
+    return web.Response(status=HTTPStatus.OK)
+
 async def update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Handle options update."""
     # for key in entry.options:
     #    _LOGGER.info("%s - %s", key, entry.options[key])
 
-    hass.config_entries.async_update_entry(entry, options=entry.options)
+    # Reload so changed poll interval and webhook settings take effect. The
+    # reconfigure step reloads the entry itself after changing the data.
+    coordinator = hass.data[DOMAIN].get(entry.entry_id)
+    if coordinator is None or coordinator.options == entry.options:
+        return
+    await hass.config_entries.async_reload(entry.entry_id)
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_close()
     return unload_ok
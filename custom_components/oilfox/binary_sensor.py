@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from datetime import timedelta
+from collections.abc import Mapping
 import logging
 from typing import Any
 
@@ -11,22 +11,14 @@ from homeassistant.components.binary_sensor import (
     BinarySensorEntity,
 )
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import (
-    CONF_EMAIL,
-    CONF_HTTP_TIMEOUT,
-    CONF_PASSWORD,
-    CONF_POLL_INTERVAL,
-    DOMAIN,
-    POLL_INTERVAL,
-    TIMEOUT,
-)
-from .OilFox import OilFox
+from .const import BATTERY_LOW, DOMAIN
+from .UpdateCoordinator import UpdateCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -45,6 +37,30 @@ BINARY_SENSORS = {
         "name": "batteryLevelStatus",
         "device_class": BinarySensorDeviceClass.BATTERY,
     },
+    "leakDetected": {
+        "id": "leakDetected",
+        "api": "anomaly",
+        "anomaly": "leak",
+        "icon": "mdi:water-alert",
+        "name": "leakDetected",
+        "device_class": BinarySensorDeviceClass.PROBLEM,
+    },
+    "refillDetected": {
+        "id": "refillDetected",
+        "api": "anomaly",
+        "anomaly": "refill",
+        "icon": "mdi:tanker-truck",
+        "name": "refillDetected",
+        "device_class": None,
+    },
+    "sensorStuck": {
+        "id": "sensorStuck",
+        "api": "anomaly",
+        "anomaly": "stuck",
+        "icon": "mdi:timer-sand-paused",
+        "name": "sensorStuck",
+        "device_class": BinarySensorDeviceClass.PROBLEM,
+    },
 }
 
 
@@ -55,65 +71,16 @@ async def async_setup_entry(
 ) -> None:
     """Initialize OilFox Integration config entry."""
 
-    _LOGGER.info("OilFox: Setup User: %s", config_entry.data[CONF_EMAIL])
-    email = config_entry.data[CONF_EMAIL]
-    password = config_entry.data[CONF_PASSWORD]
-
-    timeout = config_entry.options.get(CONF_HTTP_TIMEOUT, TIMEOUT)
-    _LOGGER.info("Timeout value: %s", timeout)
-
-    poll_interval = config_entry.options.get(CONF_POLL_INTERVAL, POLL_INTERVAL)
-    _LOGGER.info("Poll interval: %s", poll_interval)
-
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
-    coordinator.update_interval = timedelta(minutes=poll_interval)
-    _LOGGER.debug("OilFox Coordinator Data Result: %s", repr(coordinator.data))
+    _LOGGER.debug("OilFox Coordinator Data Result: %r", coordinator.data)
 
     if coordinator.data is None or coordinator.data is False:
         raise ConfigEntryNotReady(
             f"Error on Coordinator Data Result: {repr(coordinator.data)}"
         )
 
-    oilfox_devices = coordinator.data["items"]
-    entities = []
-
-    for oilfox_device in oilfox_devices:
-        _LOGGER.info("OilFox: Found Device in API: %s", oilfox_device["hwid"])
-        for sensor_key, sensor_details in BINARY_SENSORS.items():
-            _LOGGER.info(
-                "OilFox: Create Sensor %s for Device %s",
-                sensor_key,
-                oilfox_device["hwid"],
-            )
-            oilfox_binary_sensor = OilFoxBinarySensor(
-                coordinator,
-                OilFox(
-                    email,
-                    password,
-                    oilfox_device["hwid"],
-                    timeout=timeout,
-                    poll_interval=poll_interval,
-                ),
-                sensor_details,
-            )
-
-            oilfox_binary_sensor.set_api_response(oilfox_device)
-
-            # Prefill sensor state based on the device data
-            if sensor_key == "batteryLevelStatus":
-                state = oilfox_device[sensor_details["api"]] in {"WARNING", "CRITICAL"}
-            elif sensor_key == "validationErrorStatus":
-                state = "validationError" in oilfox_device
-            oilfox_binary_sensor.set_state(state)
-            _LOGGER.debug(
-                "Prefill entity %s with %s",
-                sensor_key,
-                state,
-            )
-
-            entities.append(oilfox_binary_sensor)
-
-    async_add_entities(entities)
+    # Built together with the other platform's entities during entry setup
+    async_add_entities(coordinator.platform_entities.pop(Platform.BINARY_SENSOR))
 
 
 class OilFoxBinarySensor(CoordinatorEntity, BinarySensorEntity):
@@ -121,25 +88,31 @@ class OilFoxBinarySensor(CoordinatorEntity, BinarySensorEntity):
 
     def __init__(
         self,
-        coordinator: CoordinatorEntity,
-        oilfox: OilFox,
+        coordinator: UpdateCoordinator,
+        hwid: str,
         sensor_details: dict,
+        prefill: Mapping[str, Any],
     ) -> None:
         """Init for OilFoxBinarySensor."""
         super().__init__(coordinator)
         self.sensor_details = sensor_details
-        self.oilfox = oilfox
+        self.hwid = hwid
         self.api_response = ""
 
-        self._attr_unique_id = f"OilFox-{self.oilfox.hwid}-{sensor_details['id']}"
-        self._attr_name = f"OilFox-{self.oilfox.hwid}-{sensor_details['name']}"
+        self._attr_device_info = coordinator.device_info(hwid)
+        device_name = self._attr_device_info["name"]
+        self._attr_unique_id = f"{device_name}-{sensor_details['id']}"
+        self._attr_name = f"{device_name}-{sensor_details['name']}"
         self._attr_device_class = sensor_details["device_class"]
         # self._attr_state_class = sensor_details["state_class"]
         self._attr_icon = sensor_details["icon"]
         # self._attr_native_unit_of_measurement = sensor_details["native_unit"]
         # self._attr_suggested_unit_of_measurement = sensor_details["suggested_unit"]
         self._attr_extra_state_attributes: dict[str, Any] = {}
-        self._attr_is_on = False
+        if sensor_details["api"] == "anomaly":
+            self._attr_is_on = self._anomaly_state()
+        else:
+            self._attr_is_on = prefill[sensor_details["id"]]
 
     async def async_added_to_hass(self) -> None:
         """Handle entity which will be added."""
@@ -147,22 +120,32 @@ class OilFoxBinarySensor(CoordinatorEntity, BinarySensorEntity):
 
         # ToDo - restore old states
 
+    @property
+    def available(self) -> bool:
+        """Return False if the device could not be updated."""
+        return super().available and self.hwid not in self.coordinator.stale_devices
+
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        oilfox_devices = self.coordinator.data["items"]
-        for oilfox_device in oilfox_devices:
-            if oilfox_device["hwid"] == self.oilfox.hwid:
-                if self.sensor_details["api"] == "validationErrorStatus":
-                    state = "validationError" in oilfox_device
-                elif self.sensor_details["api"] == "batteryLevel":
-                    state = oilfox_device[self.sensor_details["api"]] in {
-                        "WARNING",
-                        "CRITICAL",
-                    }
-                self.set_state(state)
-            self.async_write_ha_state()
+        oilfox_device = self.coordinator.devices.get(self.hwid)
+        if oilfox_device is None:
             return
+        if self.sensor_details["api"] == "validationErrorStatus":
+            state = "validationError" in oilfox_device
+        elif self.sensor_details["api"] == "batteryLevel":
+            state = oilfox_device[self.sensor_details["api"]] in BATTERY_LOW
+        elif self.sensor_details["api"] == "anomaly":
+            state = self._anomaly_state()
+        self.set_state(state)
+        self.async_write_ha_state()
+
+    def _anomaly_state(self) -> bool:
+        """Return the flag of the device's anomaly detector."""
+        detector = self.coordinator.anomaly_detectors.get(self.hwid)
+        return detector is not None and getattr(
+            detector, self.sensor_details["anomaly"]
+        )
 
     def set_api_response(self, response):
         """Set API response manual."""
@@ -182,11 +165,3 @@ class OilFoxBinarySensor(CoordinatorEntity, BinarySensorEntity):
                 "Set new state %s for sensor %s", state, self.sensor_details["id"]
             )
             self._attr_is_on = state
-
-    @property
-    def device_info(self) -> DeviceInfo:
-        """Return the device info."""
-        return DeviceInfo(
-            identifiers={(DOMAIN, self.oilfox.hwid)},
-            name="OilFox-" + self.oilfox.hwid,
-        )
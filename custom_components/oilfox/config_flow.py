@@ -8,15 +8,20 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries
+from homeassistant.components import webhook
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 
 from .const import (
+    CONF_DAILY_BUDGET,
     CONF_EMAIL,
     CONF_HTTP_TIMEOUT,
     CONF_PASSWORD,
     CONF_POLL_INTERVAL,
+    CONF_WEBHOOK,
+    CONF_WEBHOOK_ID,
+    DAILY_BUDGET,
     DOMAIN,
     POLL_INTERVAL,
     TIMEOUT,
@@ -163,12 +168,20 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         timeout = TIMEOUT
         poll_interval = POLL_INTERVAL
         if user_input is not None:
+            if user_input.get(CONF_WEBHOOK):
+                # Keep the webhook id stable so the bridge does not need
+                # to be reconfigured on every options change.
+                user_input[CONF_WEBHOOK_ID] = self.options.get(
+                    CONF_WEBHOOK_ID, webhook.async_generate_id()
+                )
             return self.async_create_entry(title="", data=user_input)
 
         if CONF_HTTP_TIMEOUT in self.options:
             timeout = self.options[CONF_HTTP_TIMEOUT]
         if CONF_POLL_INTERVAL in self.options:
             poll_interval = self.options[CONF_POLL_INTERVAL]
+        use_webhook = self.options.get(CONF_WEBHOOK, False)
+        daily_budget = self.options.get(CONF_DAILY_BUDGET, DAILY_BUDGET)
 
         return self.async_show_form(
             step_id="init",
@@ -182,6 +195,14 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         CONF_POLL_INTERVAL,
                         default=poll_interval,
                     ): vol.All(vol.Coerce(int), vol.Clamp(min=1, max=300)),
+                    vol.Required(
+                        CONF_WEBHOOK,
+                        default=use_webhook,
+                    ): bool,
+                    vol.Required(
+                        CONF_DAILY_BUDGET,
+                        default=daily_budget,
+                    ): vol.All(vol.Coerce(int), vol.Clamp(min=0, max=100000)),
                 }
             ),
         )
@@ -6,5 +6,63 @@ CONF_EMAIL = "email"
 CONF_PASSWORD = "password"
 CONF_HTTP_TIMEOUT = "http-timeout"
 CONF_POLL_INTERVAL = "poll-interval"
+CONF_WEBHOOK = "webhook"
+CONF_WEBHOOK_ID = "webhook_id"
+CONF_DAILY_BUDGET = "daily-budget"
 TIMEOUT = 300
 POLL_INTERVAL = 30
+# Daily API request budget per account, 0 is unlimited
+DAILY_BUDGET = 0
+
+BATTERY_MAPPING = {
+    "FULL": 100,
+    "GOOD": 70,
+    "MEDIUM": 50,
+    "WARNING": 20,
+    "CRITICAL": 0,
+}
+BATTERY_LOW = {"WARNING", "CRITICAL"}
+
+KWH_PER_L_OIL = 9.8
+# Usage counters and the factor applied to the consumed liters
+COUNTERS = {"usageCounter": KWH_PER_L_OIL, "usageCounterQuantity": 1}
+# Consumption periods, the heating season starts on the first of this month
+PERIODS = ("daily", "weekly", "monthly", "heatingSeason")
+HEATING_SEASON_START_MONTH = 10
+# Poll interval in minutes if measurements are pushed via webhook
+RECONCILE_INTERVAL = 360
+
+# Seconds to wait for cancelled API requests on unload
+UNLOAD_TIMEOUT = 5
+
+STORAGE_VERSION = 1
+STORAGE_MINOR_VERSION = 2
+STORAGE_SAVE_DELAY = 10
+
+# Upper bound in seconds for the random part of the refresh offset
+REFRESH_JITTER = 60
+# Cached snapshots older than this (seconds) are not used on startup
+SNAPSHOT_MAX_AGE = 86400
+
+# Device fields of the snapshot export, in CSV column order
+EXPORT_FIELDS = (
+    "hwid",
+    "fillLevelPercent",
+    "fillLevelQuantity",
+    "daysReach",
+    "batteryLevel",
+    "batteryPercent",
+    "validationError",
+    "currentMeteringAt",
+    "nextMeteringAt",
+    "usageCounter",
+    "usageCounterQuantity",
+)
+
+EVENT_ANOMALY = "oilfox_anomaly"
+
+SERVICE_PROFILE = "profile"
+ATTR_REFRESHES = "refreshes"
+ATTR_CALLBACK_BUDGET = "callback_budget"
+# Loop-time budget in seconds for a single listener callback
+CALLBACK_BUDGET = 0.05
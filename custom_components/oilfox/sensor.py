@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from collections.abc import Mapping
+from datetime import datetime
 import logging
 from typing import Any
 
@@ -13,27 +14,26 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import PERCENTAGE, UnitOfEnergy, UnitOfTime, UnitOfVolume
+from homeassistant.const import (
+    PERCENTAGE,
+    EntityCategory,
+    Platform,
+    UnitOfEnergy,
+    UnitOfTime,
+    UnitOfVolume,
+)
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import (
-    CONF_EMAIL,
-    CONF_HTTP_TIMEOUT,
-    CONF_PASSWORD,
-    CONF_POLL_INTERVAL,
-    DOMAIN,
-    POLL_INTERVAL,
-    TIMEOUT,
-)
-from .OilFox import OilFox
+from .const import BATTERY_MAPPING, COUNTERS, DOMAIN
+from .UpdateCoordinator import UpdateCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
-KWH_PER_L_OIL = 9.8
+TIMESTAMP_ATTRIBUTES = {"Last Measurement", "Next Measurement"}
 
 SENSORS = {
     "fillLevelPercent": {
@@ -126,6 +126,50 @@ SENSORS = {
         "device_class": SensorDeviceClass.VOLUME_STORAGE,
         "state_class": SensorStateClass.MEASUREMENT,
     },
+    "consumptionDaily": {
+        "id": "consumptionDaily",
+        "api": None,
+        "period": "daily",
+        "native_unit": UnitOfVolume.LITERS,
+        "suggested_unit": None,
+        "icon": "mdi:calendar-today",
+        "name": "consumptionDaily",
+        "device_class": SensorDeviceClass.VOLUME,
+        "state_class": SensorStateClass.TOTAL,
+    },
+    "consumptionWeekly": {
+        "id": "consumptionWeekly",
+        "api": None,
+        "period": "weekly",
+        "native_unit": UnitOfVolume.LITERS,
+        "suggested_unit": None,
+        "icon": "mdi:calendar-week",
+        "name": "consumptionWeekly",
+        "device_class": SensorDeviceClass.VOLUME,
+        "state_class": SensorStateClass.TOTAL,
+    },
+    "consumptionMonthly": {
+        "id": "consumptionMonthly",
+        "api": None,
+        "period": "monthly",
+        "native_unit": UnitOfVolume.LITERS,
+        "suggested_unit": None,
+        "icon": "mdi:calendar-month",
+        "name": "consumptionMonthly",
+        "device_class": SensorDeviceClass.VOLUME,
+        "state_class": SensorStateClass.TOTAL,
+    },
+    "consumptionHeatingSeason": {
+        "id": "consumptionHeatingSeason",
+        "api": None,
+        "period": "heatingSeason",
+        "native_unit": UnitOfVolume.LITERS,
+        "suggested_unit": None,
+        "icon": "mdi:radiator",
+        "name": "consumptionHeatingSeason",
+        "device_class": SensorDeviceClass.VOLUME,
+        "state_class": SensorStateClass.TOTAL,
+    },
 }
 
 
@@ -136,233 +180,201 @@ async def async_setup_entry(
 ) -> None:
     """Initialize OilFox Integration config entry."""
 
-    _LOGGER.info("OilFox: Setup User: %s", config_entry.data[CONF_EMAIL])
-    email = config_entry.data[CONF_EMAIL]
-    password = config_entry.data[CONF_PASSWORD]
-
-    timeout = config_entry.options.get(CONF_HTTP_TIMEOUT, TIMEOUT)
-    _LOGGER.info("Timeout value: %s", timeout)
-
-    poll_interval = config_entry.options.get(CONF_POLL_INTERVAL, POLL_INTERVAL)
-    _LOGGER.info("Poll interval: %s", poll_interval)
-
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
-    coordinator.update_interval = timedelta(minutes=poll_interval)
-    _LOGGER.debug("OilFox Coordinator Data Result: %s", repr(coordinator.data))
+    _LOGGER.debug("OilFox Coordinator Data Result: %r", coordinator.data)
 
     if not coordinator.data:
         raise ConfigEntryNotReady(
             f"Error on Coordinator Data Result: {repr(coordinator.data)}"
         )
 
-    oilfox_devices = coordinator.data["items"]
-    entities = []
-
-    for oilfox_device in oilfox_devices:
-        _LOGGER.debug("OilFox: Found Device in API: %s", oilfox_device["hwid"])
-        for sensor_key, sensor_details in SENSORS.items():
-            _LOGGER.info(
-                "OilFox: Create Sensor %s for Device %s",
-                sensor_key,
-                oilfox_device["hwid"],
-            )
-            oilfox_sensor = OilFoxSensor(
-                coordinator,
-                OilFox(
-                    email,
-                    password,
-                    oilfox_device["hwid"],
-                    timeout=timeout,
-                    poll_interval=poll_interval,
-                ),
-                sensor_details,
-            )
-            oilfox_sensor.set_api_response(oilfox_device)
-
-            # Prefill sensor state based on the device data
-            if sensor_details["api"] in oilfox_device:
-                _LOGGER.debug(
-                    "Prefill entity %s with %s",
-                    sensor_key,
-                    oilfox_device[sensor_details["api"]],
-                )
-                oilfox_sensor.set_state(oilfox_device[sensor_key])
-            elif sensor_key == "validationError":
-                _LOGGER.debug('Prefill entity %s with "No Error"', sensor_key)
-                oilfox_sensor.set_state("No Error")
-            elif sensor_key in {"usageCounter", "usageCounterQuantity"}:
-                _LOGGER.debug('Prefill entity %s with "0"', sensor_key)
-                oilfox_sensor.set_state(float(0))
-            else:
-                _LOGGER.debug("Prefill entity %s with empty value", sensor_key)
-                oilfox_sensor.set_state(None)
-
-            entities.append(oilfox_sensor)
-
-    async_add_entities(entities)
+    # Built together with the other platform's entities during entry setup
+    async_add_entities(coordinator.platform_entities.pop(Platform.SENSOR))
 
 
 class OilFoxSensor(CoordinatorEntity, RestoreSensor, SensorEntity):
     """OilFox Sensor Class."""
 
-    battery_mapping = {
-        "FULL": 100,
-        "GOOD": 70,
-        "MEDIUM": 50,
-        "WARNING": 20,
-        "CRITICAL": 0,
-    }
+    # The measurement attributes duplicate the state of the dedicated
+    # timestamp and battery sensors, keep them out of the recorder.
+    _unrecorded_attributes = frozenset(
+        {"Last Measurement", "Next Measurement", "Battery"}
+    )
+
+    battery_mapping = BATTERY_MAPPING
 
     def __init__(
         self,
-        coordinator: CoordinatorEntity,
-        oilfox: OilFox,
+        coordinator: UpdateCoordinator,
+        hwid: str,
         sensor_details: dict,
+        prefill: Mapping[str, Any],
     ) -> None:
         """Initialize the OilFox sensor."""
         super().__init__(coordinator)
         self.sensor_details = sensor_details
-        self.oilfox = oilfox
+        self.hwid = hwid
         self.api_response = ""
-        self._attr_unique_id = f"OilFox-{self.oilfox.hwid}-{sensor_details['id']}"
-        self._attr_name = f"OilFox-{self.oilfox.hwid}-{sensor_details['name']}"
+        self._attr_device_info = coordinator.device_info(hwid)
+        device_name = self._attr_device_info["name"]
+        self._attr_unique_id = f"{device_name}-{sensor_details['id']}"
+        self._attr_name = f"{device_name}-{sensor_details['name']}"
         self._attr_device_class = sensor_details["device_class"]
         self._attr_state_class = sensor_details["state_class"]
         self._attr_icon = sensor_details["icon"]
         self._attr_native_unit_of_measurement = sensor_details["native_unit"]
         self._attr_suggested_unit_of_measurement = sensor_details["suggested_unit"]
         self._attr_extra_state_attributes: dict[str, Any] = {}
+        self._stale = False
+        if sensor_details["id"] in COUNTERS:
+            # Usage counters are restored from the integration storage
+            counter = coordinator.counter(hwid, sensor_details["id"])
+            self._attr_native_value = (counter or {}).get("value", float(0))
+        elif "period" in sensor_details:
+            self._set_consumption()
+        else:
+            self._attr_native_value = prefill.get(sensor_details["api"])
 
     async def async_added_to_hass(self) -> None:
         """Handle entity which will be added."""
         await super().async_added_to_hass()
+        if self.sensor_details["id"] not in COUNTERS:
+            return
+        counter = self.coordinator.counter(self.hwid, self.sensor_details["id"])
+        if counter is None or "value" not in counter:
+            await self._async_migrate_counter(counter)
+
+    async def _async_migrate_counter(self, counter: dict[str, Any] | None) -> None:
+        """Move a counter restored from the last state into the storage."""
+        attributes: dict[str, Any] = {}
         last_state = await self.async_get_last_state()
         last_sensor_data = await self.async_get_last_sensor_data()
         if last_state:
-            if self.sensor_details["id"] in {"usageCounter", "usageCounterQuantity"}:
-                self._attr_extra_state_attributes = last_state.attributes.copy()
-                _LOGGER.debug(
-                    "Restoring attributes (state: %s) for %s: %s",
-                    last_state.state,
+            attributes = dict(last_state.attributes)
+            _LOGGER.debug(
+                "Restoring attributes (state: %s) for %s: %s",
+                last_state.state,
+                self.sensor_details["id"],
+                attributes,
+            )
+            # Workaround for the issue that the state is not restored correctly
+            # happened in BETA Update
+            if "restore_value" in attributes:
+                _LOGGER.info(
+                    "Recover value: %s for %s from user attribute",
+                    attributes["restore_value"],
                     self.sensor_details["id"],
-                    self._attr_extra_state_attributes,
                 )
-                # Workaround for the issue that the state is not restored correctly
-                # happened in BETA Update
-                if "restore_value" in self._attr_extra_state_attributes:
-                    _LOGGER.info(
-                        "Recover value: %s for %s from user attribute",
-                        self._attr_extra_state_attributes["restore_value"],
+                self.set_state(attributes.pop("restore_value"))
+            elif (
+                last_sensor_data is None
+                or last_sensor_data.native_value is None
+                or last_sensor_data.native_value == 0
+            ):
+                if last_state.state != "unknown" and float(last_state.state) > 0:
+                    self.set_state(last_state.state)
+                    _LOGGER.debug(
+                        "Restored %s value %s from state",
                         self.sensor_details["id"],
+                        last_state.state,
                     )
-                    self.set_state(
-                        self._attr_extra_state_attributes.pop("restore_value")
-                    )
-                elif (
-                    last_sensor_data is None
-                    or last_sensor_data.native_value is None
-                    or last_sensor_data.native_value == 0
-                ):
-                    if last_state.state != "unknown" and float(last_state.state) > 0:
-                        self.set_state(last_state.state)
-                        _LOGGER.debug(
-                            "Restored %s value %s from state",
-                            self.sensor_details["id"],
-                            last_state.state,
-                        )
-                    else:
-                        self.set_state(0)
-                # End Workaround
                 else:
-                    # _LOGGER.error("Native Value:%s", last_sensor_data.native_value)
-                    self.set_state(last_sensor_data.native_value)
+                    self.set_state(0)
+            # End Workaround
+            else:
+                # _LOGGER.error("Native Value:%s", last_sensor_data.native_value)
+                self.set_state(last_sensor_data.native_value)
 
-                if (
-                    "Current Value" not in self._attr_extra_state_attributes
-                    or not isinstance(
-                        self._attr_extra_state_attributes["Current Value"], int
-                    )
-                ):
-                    _LOGGER.debug(
-                        "Current Value is None for %s, setting it to zero",
-                        self.sensor_details["id"],
-                    )
-                    self._attr_extra_state_attributes["Current Value"] = 0
-                if (
-                    "Previous Value" not in self._attr_extra_state_attributes
-                    or not isinstance(
-                        self._attr_extra_state_attributes["Previous Value"], int
-                    )
-                ):
-                    _LOGGER.debug(
-                        "Previous Value is None for %s, setting it to zero",
-                        self.sensor_details["id"],
-                    )
-                    self._attr_extra_state_attributes["Previous Value"] = 0
+        # Older versions kept the bookkeeping in the state attributes
+        if counter is None:
+            counter = {
+                "current": attributes.get("Current Value"),
+                "previous": attributes.get("Previous Value"),
+            }
+        _LOGGER.debug(
+            "Migrate counter %s (%s) for %s into storage",
+            self._attr_native_value,
+            counter,
+            self.sensor_details["id"],
+        )
+        self.coordinator.async_seed_counter(
+            self.hwid,
+            self.sensor_details["id"],
+            float(self._attr_native_value),
+            counter["current"] if isinstance(counter["current"], int) else 0,
+            counter["previous"] if isinstance(counter["previous"], int) else 0,
+        )
+
+    @property
+    def available(self) -> bool:
+        """Return False if the device could not be updated."""
+        return super().available and self.hwid not in self.coordinator.stale_devices
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        oilfox_devices = self.coordinator.data["items"]
-        for oilfox_device in oilfox_devices:
-            if oilfox_device["hwid"] == self.oilfox.hwid:
-                self.set_api_response(oilfox_device)
-                if self.sensor_details["api"] in oilfox_device:
-                    self.set_state(oilfox_device[self.sensor_details["api"]])
-                    self._attr_extra_state_attributes = {
-                        "Last Measurement": self.api_response.get("currentMeteringAt"),
-                        "Next Measurement": self.api_response.get("nextMeteringAt"),
-                        "Battery": self.api_response.get("batteryLevel"),
-                    }
-                    self.async_write_ha_state()
-                elif self.sensor_details["id"] == "validationError":
-                    self.set_state("No Error")
-                elif self.sensor_details["id"] in [
-                    "usageCounterQuantity",
-                    "usageCounter",
-                ]:
-                    current_value = int(
-                        self._attr_extra_state_attributes["Current Value"]
-                    )
-                    fillLevelQuantity = int(self.api_response.get("fillLevelQuantity"))
-                    if current_value != fillLevelQuantity:
-                        if fillLevelQuantity < current_value:
-                            new_value = 0
-                            if self.sensor_details["id"] == "usageCounterQuantity":
-                                new_value = round(
-                                    float(self._attr_native_value)
-                                    + (current_value - fillLevelQuantity),
-                                    2,
-                                )
-                            elif self.sensor_details["id"] == "usageCounter":
-                                new_value = round(
-                                    float(self._attr_native_value)
-                                    + (
-                                        (current_value - fillLevelQuantity)
-                                        * KWH_PER_L_OIL
-                                    ),
-                                    2,
-                                )
-                            self.set_state(new_value)
-                        self._attr_extra_state_attributes["Previous Value"] = (
-                            self._attr_extra_state_attributes["Current Value"]
-                        )
-                        self._attr_extra_state_attributes["Current Value"] = (
-                            fillLevelQuantity
-                        )
-                        self.async_write_ha_state()
-                    else:
-                        _LOGGER.debug(
-                            "Current Value and fillLevelQuantity are the same for %s, skip",
-                            self.sensor_details["id"],
-                        )
+        oilfox_device = self.coordinator.devices.get(self.hwid)
+        if oilfox_device is None:
+            return
+        stale = self.hwid in self.coordinator.stale_devices
+        if stale or self._stale:
+            # Availability changed or values are outdated, always write
+            self._stale = stale
+            self.async_write_ha_state()
+            if stale:
+                return
+        self.set_api_response(oilfox_device)
+        if self.sensor_details["api"] in oilfox_device:
+            changed = self.set_state(oilfox_device[self.sensor_details["api"]])
+            attributes = self.coordinator.device_attributes[self.hwid]
+            if changed or self._has_new_attributes(attributes):
+                self._attr_extra_state_attributes = attributes
+                self.async_write_ha_state()
+            else:
+                _LOGGER.debug(
+                    "Only timestamps changed for %s, skip state write",
+                    self.sensor_details["id"],
+                )
+        elif self.sensor_details["id"] == "validationError":
+            self.set_state("No Error")
+        elif self.sensor_details["id"] in COUNTERS:
+            counter = self.coordinator.counter(self.hwid, self.sensor_details["id"])
+            if counter is not None and self.set_state(counter["value"]):
+                self.async_write_ha_state()
+        elif "period" in self.sensor_details:
+            if self._set_consumption():
+                self.async_write_ha_state()
+
+    def _set_consumption(self) -> bool:
+        """Take the period consumption from the coordinator, True if changed."""
+        consumption = self.coordinator.consumption(
+            self.hwid, self.sensor_details["period"]
+        )
+        if consumption is None:
+            return False
+        value, last_reset = consumption
+        if value == self._attr_native_value and last_reset == self._attr_last_reset:
+            return False
+        self._attr_native_value = value
+        self._attr_last_reset = last_reset
+        return True
 
     def set_api_response(self, response: dict) -> None:
         """Set API response manually."""
         self.api_response = response
 
-    def set_state(self, state: str | float | None) -> None:
-        """Set state manually."""
+    def _has_new_attributes(self, attributes: Mapping[str, Any]) -> bool:
+        """Return True if attributes changed beyond the measurement timestamps."""
+        if attributes is self._attr_extra_state_attributes:
+            return False
+        return any(
+            value != self._attr_extra_state_attributes.get(key)
+            for key, value in attributes.items()
+            if key not in TIMESTAMP_ATTRIBUTES
+        )
+
+    def set_state(self, state: str | float | None) -> bool:
+        """Set state manually, return True if the state changed."""
         if (
             state == self.native_value
             or (
@@ -379,7 +391,7 @@ class OilFoxSensor(CoordinatorEntity, RestoreSensor, SensorEntity):
                 state,
                 self.sensor_details["id"],
             )
-            return
+            return False
         if state is not None and state != "":
             if self.sensor_details["api"] == "batteryLevel":
                 self._attr_native_value = self.battery_mapping.get(state, None)
@@ -390,11 +402,56 @@ class OilFoxSensor(CoordinatorEntity, RestoreSensor, SensorEntity):
             _LOGGER.debug(
                 "Set new state %s for sensor %s", state, self.sensor_details["id"]
             )
+            return True
+        return False
 
-    @property
-    def device_info(self) -> DeviceInfo:
-        """Return the device info."""
-        return DeviceInfo(
-            identifiers={(DOMAIN, self.oilfox.hwid)},
-            name=f"OilFox-{self.oilfox.hwid}",
+
+class OilFoxBudgetSensor(CoordinatorEntity, SensorEntity):
+    """OilFox API request budget sensor of an account."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _unrecorded_attributes = frozenset({"Requests"})
+    _attr_icon = "mdi:api"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator: UpdateCoordinator) -> None:
+        """Initialize the budget sensor."""
+        super().__init__(coordinator)
+        entry = coordinator.config_entry
+        self._attr_unique_id = f"OilFox-{entry.entry_id}-apiBudgetRemaining"
+        self._attr_name = f"OilFox-{entry.title}-apiBudgetRemaining"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name=entry.title,
+        )
+        self._written: tuple | None = None
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only if the remaining budget or interval changed.
+
+        The request counts change with every refresh and would add a state
+        row per poll.
+        """
+        written = (
+            self.available,
+            self.native_value,
+            self.coordinator.update_interval,
         )
+        if written != self._written:
+            self._written = written
+            self.async_write_ha_state()
+
+    @property
+    def native_value(self) -> int | None:
+        """Return the requests left in the rolling 24 h window."""
+        return self.coordinator.request_budget.remaining()
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the requests per endpoint and the poll interval."""
+        return {
+            "Daily Budget": self.coordinator.request_budget.daily_budget,
+            "Requests": self.coordinator.request_budget.used(),
+            "Poll Interval": str(self.coordinator.update_interval),
+        }
@@ -0,0 +1,186 @@
+"""Fixtures for the OilFox tests."""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from collections.abc import AsyncGenerator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.oilfox.const import CONF_EMAIL, CONF_PASSWORD, DOMAIN
+from custom_components.oilfox.OilFox import OilFox
+
+# First measurement of the fake devices, recent enough to not count as stuck
+START = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations: None) -> None:
+    """Enable the custom integration in all tests."""
+
+
+class FakeOilFoxApi:
+    """OilFox customer API on a local test server.
+
+    Every device consumes a fixed amount of oil per measurement, advance()
+    takes the next measurement of all devices. Set devices_status to fail the
+    bulk request and add hwids to failing to fail their single requests.
+    """
+
+    def __init__(self, devices: int) -> None:
+        """Init the API with the given number of devices."""
+        self.items = [self._device(index) for index in range(devices)]
+        self.requests: Counter[str] = Counter()
+        self.access_token = ""
+        self.devices_status = 200
+        self.failing: set[str] = set()
+        self.hang = asyncio.Event()
+        self.hanging = asyncio.Event()
+        self.released = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_post("/customer-api/v1/login", self.handle_login)
+        self.app.router.add_post("/customer-api/v1/token", self.handle_token)
+        self.app.router.add_get("/customer-api/v1/device", self.handle_devices)
+        self.app.router.add_get("/customer-api/v1/device/{hwid}", self.handle_device)
+
+    @staticmethod
+    def _device(index: int) -> dict[str, Any]:
+        """Return the first reading of a device."""
+        return {
+            "hwid": f"HW{index:04d}",
+            "fillLevelPercent": 80,
+            "fillLevelQuantity": 4000,
+            "daysReach": 200,
+            "batteryLevel": "FULL",
+            "quantityUnit": "L",
+            "currentMeteringAt": START.isoformat(),
+            "nextMeteringAt": (START + timedelta(days=1)).isoformat(),
+        }
+
+    def advance(self, interval: timedelta = timedelta(days=1)) -> None:
+        """Take the next measurement of all devices after interval."""
+        for item in self.items:
+            measured = datetime.fromisoformat(item["currentMeteringAt"]) + interval
+            item["fillLevelQuantity"] -= 10
+            item["fillLevelPercent"] = item["fillLevelQuantity"] // 50
+            item["daysReach"] = item["fillLevelQuantity"] // 20
+            item["currentMeteringAt"] = measured.isoformat()
+            item["nextMeteringAt"] = (measured + interval).isoformat()
+
+    async def _maybe_hang(self) -> None:
+        """Block the request while the API hangs."""
+        if self.hang.is_set():
+            self.hanging.set()
+            await self.released.wait()
+
+    def revoke_tokens(self) -> None:
+        """Reject the issued tokens like an expired session."""
+        self.access_token = ""
+
+    def _authorized(self, request: web.Request) -> bool:
+        """Return True if the request carries the issued access token."""
+        return bool(self.access_token) and (
+            request.headers.get("Authorization") == f"Bearer {self.access_token}"
+        )
+
+    async def handle_login(self, request: web.Request) -> web.Response:
+        """Handle the login."""
+        self.requests["login"] += 1
+        return await self._issue_tokens()
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        """Handle the token refresh."""
+        self.requests["token"] += 1
+        return await self._issue_tokens()
+
+    async def _issue_tokens(self) -> web.Response:
+        """Return a new access token."""
+        await self._maybe_hang()
+        self.access_token = f"access{self.requests.total()}"
+        return web.json_response(
+            {"access_token": self.access_token, "refresh_token": "refresh"}
+        )
+
+    async def handle_devices(self, request: web.Request) -> web.Response:
+        """Return all devices."""
+        self.requests["devices"] += 1
+        await self._maybe_hang()
+        if not self._authorized(request):
+            return web.Response(status=401)
+        if self.devices_status != 200:
+            return web.Response(status=self.devices_status)
+        return web.json_response({"items": self.items})
+
+    async def handle_device(self, request: web.Request) -> web.Response:
+        """Return a single device."""
+        self.requests["device"] += 1
+        await self._maybe_hang()
+        if not self._authorized(request):
+            return web.Response(status=401)
+        hwid = request.match_info["hwid"]
+        if hwid in self.failing:
+            return web.Response(status=500)
+        for item in self.items:
+            if item["hwid"] == hwid:
+                return web.json_response(item)
+        return web.Response(status=404)
+
+
+@pytest.fixture
+def api_devices() -> int:
+    """Return the number of devices of the fake API."""
+    return 3
+
+
+@pytest.fixture
+async def oilfox_api(
+    socket_enabled: None, api_devices: int
+) -> AsyncGenerator[FakeOilFoxApi]:
+    """Serve the fake OilFox API and point the client to it."""
+    api = FakeOilFoxApi(api_devices)
+    server = TestServer(api.app, host="127.0.0.1")
+    await server.start_server()
+    base_url = str(server.make_url("")).rstrip("/")
+    with (
+        patch.object(OilFox, "login_url", f"{base_url}/customer-api/v1/login"),
+        patch.object(OilFox, "token_url", f"{base_url}/customer-api/v1/token"),
+        patch.object(OilFox, "device_url", f"{base_url}/customer-api/v1/device"),
+    ):
+        yield api
+    api.released.set()
+    await server.close()
+
+
+@pytest.fixture
+def config_entry(hass: HomeAssistant) -> MockConfigEntry:
+    """Return a config entry of an OilFox account."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="OilFox",
+        unique_id="user@example.com",
+        data={CONF_EMAIL: "user@example.com", CONF_PASSWORD: "secret"},
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+@pytest.fixture
+async def setup_entry(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, config_entry: MockConfigEntry
+) -> AsyncGenerator[MockConfigEntry]:
+    """Set up the integration against the fake API."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    yield config_entry
+    oilfox_api.released.set()
+    await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
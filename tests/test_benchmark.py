@@ -0,0 +1,55 @@
+"""Setup time benchmark for accounts with many devices."""
+
+from __future__ import annotations
+
+import logging
+import time
+
+import pytest
+
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.oilfox.binary_sensor import BINARY_SENSORS
+from custom_components.oilfox.sensor import SENSORS
+
+from .conftest import FakeOilFoxApi
+
+# Enforced limit of the setup time, about twice the measured values. Most of
+# it is spent by Home Assistant to register and add the entities.
+MAX_SETUP_SECONDS = 0.5
+MAX_SECONDS_PER_DEVICE = 0.015
+
+
+@pytest.mark.parametrize("api_devices", [1, 50, 500])
+async def test_setup_time(
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    config_entry: MockConfigEntry,
+    caplog: pytest.LogCaptureFixture,
+    api_devices: int,
+) -> None:
+    """Test the setup time scales with the devices and logs only a summary."""
+    caplog.set_level(logging.INFO, logger="custom_components.oilfox")
+    start = time.perf_counter()
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    elapsed = time.perf_counter() - start
+
+    entities = api_devices * (len(SENSORS) + len(BINARY_SENSORS))
+    assert len(hass.states.async_all()) == entities
+    print(
+        f"\n{api_devices} devices, {entities} entities: setup {elapsed * 1000:.0f} ms,"
+        f" {elapsed / api_devices * 1000:.2f} ms per device"
+    )
+    assert elapsed < MAX_SETUP_SECONDS + MAX_SECONDS_PER_DEVICE * api_devices
+    setup_logs = [
+        record
+        for record in caplog.records
+        if record.name.startswith("custom_components.oilfox")
+        and record.levelno >= logging.INFO
+    ]
+    assert len(setup_logs) == 1
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
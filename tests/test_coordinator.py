@@ -0,0 +1,131 @@
+"""Tests for the OilFox update coordinator."""
+
+import pytest
+
+from homeassistant.const import STATE_UNAVAILABLE
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.oilfox.const import DOMAIN
+
+from .conftest import FakeOilFoxApi
+
+COUNTER = "sensor.oilfox_hw0000_usagecounterquantity"
+DAILY = "sensor.oilfox_hw0000_consumptiondaily"
+
+
+async def _async_refresh(hass: HomeAssistant, entry: MockConfigEntry) -> None:
+    """Poll the API and wait for the entities."""
+    await hass.data[DOMAIN][entry.entry_id].async_refresh()
+    await hass.async_block_till_done()
+
+
+async def test_ingest_newer_reading(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test a pushed reading is counted once and kept by the next poll."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    # New counters start counting with the first poll after setup
+    await _async_refresh(hass, setup_entry)
+    oilfox_api.advance()
+    pushed = dict(oilfox_api.items[0])
+    # The cloud API has not seen the pushed measurement yet
+    oilfox_api.items[0] = FakeOilFoxApi._device(0)
+
+    assert coordinator.async_ingest_devices([pushed]) == 1
+    await hass.async_block_till_done()
+    assert float(hass.states.get(COUNTER).state) == 10.0
+
+    await _async_refresh(hass, setup_entry)
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == "3990"
+    assert float(hass.states.get(COUNTER).state) == 10.0
+    assert float(hass.states.get(DAILY).state) == 10.0
+
+
+async def test_ingest_older_reading(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test a late pushed reading does not count the consumption twice."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    await _async_refresh(hass, setup_entry)
+    previous = dict(oilfox_api.items[0])
+    oilfox_api.advance()
+    await _async_refresh(hass, setup_entry)
+    assert float(hass.states.get(COUNTER).state) == 10.0
+
+    assert coordinator.async_ingest_devices([previous]) == 0
+    assert coordinator.async_ingest_devices([dict(oilfox_api.items[0])]) == 0
+    await _async_refresh(hass, setup_entry)
+
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == "3990"
+    assert float(hass.states.get(COUNTER).state) == 10.0
+    assert float(hass.states.get(DAILY).state) == 10.0
+
+
+async def test_fallback_per_device(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test a failed bulk request updates the devices one by one."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    oilfox_api.devices_status = 400
+    oilfox_api.failing.add("HW0001")
+    oilfox_api.advance()
+    await _async_refresh(hass, setup_entry)
+
+    assert coordinator.last_update_success
+    assert oilfox_api.requests["device"] == 3
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == "3990"
+    assert hass.states.get("sensor.oilfox_hw0001_filllevelquantity").state == (
+        STATE_UNAVAILABLE
+    )
+    assert hass.states.get("sensor.oilfox_hw0002_filllevelquantity").state == "3990"
+
+
+async def test_fallback_all_devices_fail(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test the refresh fails if no device could be updated."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    oilfox_api.devices_status = 400
+    oilfox_api.failing.update(item["hwid"] for item in oilfox_api.items)
+    await _async_refresh(hass, setup_entry)
+
+    assert not coordinator.last_update_success
+    assert oilfox_api.requests["device"] == 3
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+async def test_no_fallback_on_api_errors(
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    setup_entry: MockConfigEntry,
+    status: int,
+) -> None:
+    """Test rate limits and server errors do not fetch every device."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    oilfox_api.devices_status = status
+    for _ in range(3):
+        await _async_refresh(hass, setup_entry)
+
+    assert not coordinator.last_update_success
+    assert oilfox_api.requests["devices"] == 4
+    assert oilfox_api.requests["device"] == 0
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == (
+        STATE_UNAVAILABLE
+    )
+
+
+async def test_login_on_rejected_token(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test a rejected access token logs in again and retries once."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    oilfox_api.revoke_tokens()
+    oilfox_api.advance()
+    await _async_refresh(hass, setup_entry)
+
+    assert coordinator.last_update_success
+    assert oilfox_api.requests["login"] == 2
+    assert oilfox_api.requests["devices"] == 3
+    assert oilfox_api.requests["device"] == 0
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == "3990"
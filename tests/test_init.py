@@ -0,0 +1,121 @@
+"""Tests for the OilFox setup and unload."""
+
+import asyncio
+from datetime import timedelta
+import time
+from unittest.mock import patch
+
+import pytest
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.oilfox.const import (
+    CONF_DAILY_BUDGET,
+    CONF_PASSWORD,
+    CONF_POLL_INTERVAL,
+    DOMAIN,
+    UNLOAD_TIMEOUT,
+)
+from custom_components.oilfox.UpdateCoordinator import UpdateCoordinator
+
+from .conftest import FakeOilFoxApi
+
+BUDGET_SENSOR = "sensor.oilfox_oilfox_apibudgetremaining"
+
+
+async def test_setup_entry(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test the entities of all devices are set up."""
+    assert setup_entry.state is ConfigEntryState.LOADED
+    state = hass.states.get("sensor.oilfox_hw0000_filllevelquantity")
+    assert state is not None
+    assert state.state == "4000"
+    # Without a request budget there is nothing to show
+    assert hass.states.get(BUDGET_SENSOR) is None
+
+
+@pytest.mark.parametrize(("refresh_delay", "requests"), [(5, 1), (600, 2)])
+async def test_cold_start_refresh(
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    config_entry: MockConfigEntry,
+    refresh_delay: float,
+    requests: int,
+) -> None:
+    """Test a setup without cache skips a staggered refresh right after it."""
+    with patch.object(UpdateCoordinator, "refresh_delay", return_value=refresh_delay):
+        assert await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=refresh_delay))
+    await hass.async_block_till_done()
+
+    assert oilfox_api.requests["devices"] == requests
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_budget_sensor(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, config_entry: MockConfigEntry
+) -> None:
+    """Test the remaining requests of a configured budget."""
+    hass.config_entries.async_update_entry(
+        config_entry, options={CONF_DAILY_BUDGET: 1000}
+    )
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+    state = hass.states.get(BUDGET_SENSOR)
+    assert int(state.state) == 1000 - sum(oilfox_api.requests.values())
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_update_listener(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test only option changes reload the entry."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    # The reconfigure step schedules its own reload
+    hass.config_entries.async_update_entry(
+        setup_entry, data={**setup_entry.data, CONF_PASSWORD: "changed"}
+    )
+    await hass.async_block_till_done()
+    assert hass.data[DOMAIN][setup_entry.entry_id] is coordinator
+
+    hass.config_entries.async_update_entry(
+        setup_entry, options={CONF_POLL_INTERVAL: 60}
+    )
+    await hass.async_block_till_done()
+    assert setup_entry.state is ConfigEntryState.LOADED
+    reloaded = hass.data[DOMAIN][setup_entry.entry_id]
+    assert reloaded is not coordinator
+    assert reloaded.update_interval == timedelta(minutes=60)
+
+
+async def test_reload_with_hanging_api(
+    hass: HomeAssistant, oilfox_api: FakeOilFoxApi, setup_entry: MockConfigEntry
+) -> None:
+    """Test a reload cancels a hanging refresh instead of waiting for it."""
+    coordinator = hass.data[DOMAIN][setup_entry.entry_id]
+    oilfox_api.hang.set()
+    refresh = hass.async_create_task(coordinator.async_refresh())
+    await asyncio.wait_for(oilfox_api.hanging.wait(), 1)
+
+    start = time.monotonic()
+    assert await hass.config_entries.async_reload(setup_entry.entry_id)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < UNLOAD_TIMEOUT
+    assert refresh.done()
+    assert not coordinator.last_update_success
+    assert setup_entry.state is ConfigEntryState.LOADED
+    # The reloaded entry shows the cached snapshot
+    state = hass.states.get("sensor.oilfox_hw0000_filllevelquantity")
+    assert state.state == "4000"
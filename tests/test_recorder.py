@@ -0,0 +1,90 @@
+"""Recorder write volume of the OilFox entities."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from homeassistant.components.recorder import Recorder
+from homeassistant.components.recorder.db_schema import StateAttributes, States
+from homeassistant.components.recorder.util import session_scope
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from custom_components.oilfox.const import DOMAIN, POLL_INTERVAL
+
+from .conftest import FakeOilFoxApi
+
+DEVICES = 5
+# A day of polls with a new measurement every 6 hours
+POLLS_PER_DAY = 24 * 60 // POLL_INTERVAL
+MEASUREMENT_INTERVAL = timedelta(hours=6)
+
+# Enforced limits of the rows written per device and day. Before the volatile
+# attributes were dropped a day wrote 40 state and 40 attribute rows per
+# device. Now it writes 45 state rows, including the consumption and anomaly
+# entities added since, and no attribute rows. An entity writing on every poll
+# adds 48 rows.
+MAX_STATE_ROWS = 46
+MAX_ATTRIBUTE_ROWS = 1
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(
+    recorder_mock: Recorder, enable_custom_integrations: None
+) -> None:
+    """Set up the recorder before Home Assistant starts."""
+
+
+def _count_rows(hass: HomeAssistant) -> tuple[int, int]:
+    """Return the number of state and state attribute rows."""
+    with session_scope(hass=hass, read_only=True) as session:
+        return (
+            session.execute(select(func.count(States.state_id))).scalar(),
+            session.execute(select(func.count(StateAttributes.attributes_id))).scalar(),
+        )
+
+
+@pytest.mark.parametrize("api_devices", [DEVICES])
+async def test_rows_per_device_and_day(
+    recorder_mock: Recorder,
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    config_entry: MockConfigEntry,
+) -> None:
+    """Test the rows a day of polling writes to the recorder."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    await async_wait_recording_done(hass)
+    states_before, attributes_before = await recorder_mock.async_add_executor_job(
+        _count_rows, hass
+    )
+
+    polls_per_measurement = POLLS_PER_DAY * MEASUREMENT_INTERVAL // timedelta(days=1)
+    for poll in range(1, POLLS_PER_DAY + 1):
+        if poll % polls_per_measurement == 0:
+            oilfox_api.advance(MEASUREMENT_INTERVAL)
+        await coordinator.async_refresh()
+        await hass.async_block_till_done()
+    await async_wait_recording_done(hass)
+    states_after, attributes_after = await recorder_mock.async_add_executor_job(
+        _count_rows, hass
+    )
+
+    state_rows = (states_after - states_before) / DEVICES
+    attribute_rows = (attributes_after - attributes_before) / DEVICES
+    print(
+        f"\nPer device and day: {state_rows:.0f} state rows, "
+        f"{attribute_rows:.0f} state attribute rows"
+    )
+    assert state_rows <= MAX_STATE_ROWS
+    assert attribute_rows <= MAX_ATTRIBUTE_ROWS
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
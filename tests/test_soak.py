@@ -0,0 +1,190 @@
+"""Soak test of the refresh pipeline with many devices.
+
+Runs long sequences of refreshes against the fake API and enforces limits on
+the memory per entity, the growth of memory and live objects over the run and
+the latency from a refresh to the last state write.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+import gc
+import logging
+import statistics
+import time
+import tracemalloc
+
+import pytest
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from pytest_homeassistant_custom_component.common import MockConfigEntry, flush_store
+
+from custom_components.oilfox.const import DOMAIN
+from custom_components.oilfox.UpdateCoordinator import UpdateCoordinator
+
+from .conftest import FakeOilFoxApi
+
+REFRESHES = 250
+# The instance dicts of the entities grow once after about 15 state writes,
+# fillLevelPercent changes every 5th refresh.
+WARMUP = 100
+SAMPLE_EVERY = 10
+
+# Enforced limits per device, about twice the largest measured values of the
+# 50, 200 and 500 device runs. The memory per entity includes the entity and
+# device registry entries and the states. Memory is not flat but drops every
+# few dozen refreshes, the trend over the samples is flat. Leaking one object
+# per device and refresh is far above the object limit.
+MAX_BYTES_PER_ENTITY = 16 * 1024
+MAX_GROWTH_PER_DEVICE_AND_REFRESH = 32
+MAX_OBJECT_GROWTH_PER_DEVICE = 40
+MAX_LATENCY_P95_PER_DEVICE = 0.004
+
+pytestmark = pytest.mark.parametrize(
+    "api_devices",
+    [
+        50,
+        pytest.param(200, marks=pytest.mark.slow),
+        pytest.param(500, marks=pytest.mark.slow),
+    ],
+)
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs(caplog: pytest.LogCaptureFixture) -> None:
+    """Keep the captured log records out of the measured memory."""
+    caplog.set_level(logging.ERROR)
+
+
+# Allocations of the test environment: the source lines of the logged stack
+# frames, the data written to the mocked storage and the captured log records
+HARNESS_FILTERS = [
+    tracemalloc.Filter(False, "*/linecache.py"),
+    tracemalloc.Filter(False, "*/homeassistant/util/json.py"),
+    tracemalloc.Filter(False, "*/logging/__init__.py"),
+]
+
+
+def _traced_memory() -> int:
+    """Return the traced memory after a full collection."""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _setup_memory() -> int:
+    """Return the traced memory without the allocations of the test setup."""
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(HARNESS_FILTERS)
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+def _object_counts() -> Counter[str]:
+    """Return the live objects by type name."""
+    gc.collect()
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+async def _refresh(
+    hass: HomeAssistant, coordinator: UpdateCoordinator, oilfox_api: FakeOilFoxApi
+) -> float:
+    """Refresh with new readings, return the seconds until the last state write."""
+    last_write = 0.0
+
+    @callback
+    def _state_changed(event: Event) -> None:
+        nonlocal last_write
+        last_write = time.perf_counter()
+
+    unsub = hass.bus.async_listen(EVENT_STATE_CHANGED, _state_changed)
+    oilfox_api.advance()
+    start = time.perf_counter()
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    unsub()
+    assert coordinator.last_update_success
+    assert last_write > start, "refresh wrote no state"
+    return last_write - start
+
+
+async def test_soak_memory(
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    config_entry: MockConfigEntry,
+    api_devices: int,
+) -> None:
+    """Test the memory per entity and that memory and objects do not grow."""
+    tracemalloc.start()
+    try:
+        before_setup = _setup_memory()
+        assert await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+        entities = len(hass.states.async_all())
+        bytes_per_entity = (_setup_memory() - before_setup) / entities
+
+        coordinator = hass.data[DOMAIN][config_entry.entry_id]
+        samples = []
+        for refresh in range(REFRESHES):
+            await _refresh(hass, coordinator, oilfox_api)
+            if refresh == WARMUP:
+                # The delayed storage writes replace the setup data once
+                await flush_store(er.async_get(hass)._store)
+                await flush_store(dr.async_get(hass)._store)
+                await flush_store(coordinator._store)
+                objects_start = _object_counts()
+            if refresh >= WARMUP and refresh % SAMPLE_EVERY == 0:
+                samples.append((refresh, _traced_memory()))
+        object_growth = _object_counts() - objects_start
+    finally:
+        tracemalloc.stop()
+    # Least squares trend of the memory over the refreshes
+    growth_per_refresh = statistics.linear_regression(*zip(*samples)).slope
+
+    print(
+        f"\n{entities} entities, {bytes_per_entity:.0f} bytes per entity, "
+        f"{growth_per_refresh:.0f} bytes growth per refresh, "
+        f"object growth {object_growth.total()} {object_growth.most_common(5)}"
+    )
+    assert bytes_per_entity < MAX_BYTES_PER_ENTITY
+    assert growth_per_refresh < MAX_GROWTH_PER_DEVICE_AND_REFRESH * api_devices
+    assert object_growth.total() < MAX_OBJECT_GROWTH_PER_DEVICE * api_devices
+    assert hass.states.get("sensor.oilfox_hw0000_filllevelquantity").state == str(
+        4000 - 10 * REFRESHES
+    )
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_soak_latency(
+    hass: HomeAssistant,
+    oilfox_api: FakeOilFoxApi,
+    config_entry: MockConfigEntry,
+    api_devices: int,
+) -> None:
+    """Test the latency from a refresh to the last state write."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+
+    # Full collections of the test process would dominate the percentile,
+    # only the objects created by the refreshes are collected.
+    gc.collect()
+    gc.freeze()
+    try:
+        latencies = [
+            await _refresh(hass, coordinator, oilfox_api) for _ in range(REFRESHES)
+        ]
+    finally:
+        gc.unfreeze()
+    latency_p95 = statistics.quantiles(latencies[WARMUP:], n=20)[-1]
+
+    print(
+        f"\nlatency median {statistics.median(latencies) * 1000:.1f} ms, "
+        f"p95 {latency_p95 * 1000:.1f} ms"
+    )
+    assert latency_p95 < MAX_LATENCY_P95_PER_DEVICE * api_devices
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()